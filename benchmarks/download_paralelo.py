@@ -0,0 +1,71 @@
+"""Compara o download em uma conexão com o download em várias conexões (HTTP Range)
+
+Uso:
+    python benchmarks/download_paralelo.py [--tamanho-mb 64] [--conexoes 1 2 4 8]
+                                           [--velocidade-conexao 2000000] [--saida resultado.json]
+
+Sobe um servidor HTTP local que entrega um arquivo sintético limitando a
+velocidade de cada conexão (como o YouTube faz por conexão) e baixa o mesmo
+arquivo com baixar_por_intervalos para cada quantidade de conexões. Também
+registra o pico de memória alocada pelo Python em cada rodada.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from servidor_midia import criar_servidor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tamanho-mb', type=int, default=64)
+    parser.add_argument('--conexoes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--velocidade-conexao', type=float, default=2_000_000, help='bytes/s por conexão')
+    parser.add_argument('--saida', help='grava o resultado JSON neste arquivo')
+    args = parser.parse_args(argv)
+    
+    from core import baixar_por_intervalos, tamanho_remoto
+    
+    conteudo = os.urandom(args.tamanho_mb * 1024 * 1024)
+    servidor = criar_servidor(conteudo, args.velocidade_conexao)
+    url = f'{servidor.url}/video.mp4'
+    
+    rodadas = []
+    with tempfile.TemporaryDirectory() as pasta:
+        tamanho = tamanho_remoto(url)
+        for conexoes in args.conexoes:
+            destino = os.path.join(pasta, f'{conexoes}.mp4')
+            tracemalloc.start()
+            relatorio = baixar_por_intervalos(url, destino, tamanho, conexoes)
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(destino, 'rb') as f:
+                relatorio['conteudo_ok'] = f.read() == conteudo
+            relatorio['pico_memoria_bytes'] = pico
+            rodadas.append(relatorio)
+            os.remove(destino)
+    servidor.shutdown()
+    
+    base = next((r for r in rodadas if r['conexoes'] == 1), rodadas[0])
+    for rodada in rodadas:
+        rodada['aceleracao_medida'] = round(base['segundos'] / rodada['segundos'], 2) if rodada['segundos'] else None
+    
+    resultado = {
+        'tamanho_bytes': len(conteudo),
+        'velocidade_conexao_bps': args.velocidade_conexao,
+        'rodadas': rodadas,
+    }
+    texto = json.dumps(resultado, indent=2)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+    print(texto)
+
+
+if __name__ == '__main__':
+    main()
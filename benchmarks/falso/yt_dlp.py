@@ -0,0 +1,99 @@
+"""Substituto do yt_dlp para os benchmarks: nada sai da máquina
+
+Implementa só o que o core usa. Playlists são geradas a partir da URL
+(list=PL<quantidade>_<semente> gera <quantidade> vídeos) e os downloads
+buscam o conteúdo no servidor de benchmarks/servidor_midia.py, cujo
+endereço vem da variável BENCH_SERVIDOR.
+"""
+import os
+import re
+import time
+import urllib.request
+
+SERVIDOR = os.environ.get('BENCH_SERVIDOR', 'http://127.0.0.1:8000')
+BLOCO = 64 * 1024
+
+
+class DownloadError(Exception):
+    pass
+
+
+def _id_video(semente, indice):
+    return f'{semente[:4]}{indice:07d}'
+
+
+class YoutubeDL:
+    def __init__(self, params=None):
+        self.params = dict(params or {})
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+    
+    def extract_info(self, url, download=True, process=True, **kwargs):
+        lista = re.search(r'list=PL(\d+)_(\w+)', url)
+        if lista:
+            quantidade, semente = int(lista.group(1)), lista.group(2)
+            entradas = ({'_type': 'url', 'id': _id_video(semente, i), 'title': f'Faixa {i} ({semente})'}
+                        for i in range(quantidade))
+            return {
+                '_type': 'playlist',
+                'id': f'PL{quantidade}_{semente}',
+                'title': f'Playlist {semente}',
+                'playlist_count': quantidade,
+                'entries': list(entradas) if process else entradas,
+            }
+        
+        video = re.search(r'(?:v=|youtu\.be/)([\w-]+)', url)
+        if not video:
+            raise DownloadError(f'URL não suportada: {url}')
+        info = {
+            'id': video.group(1),
+            'title': f'Vídeo {video.group(1)}',
+            'ext': 'webm',
+            'url': f'{SERVIDOR}/midia/{video.group(1)}',
+            'protocol': 'http',
+        }
+        if download:
+            return self.process_ie_result(info, download=True)
+        return info
+    
+    def process_ie_result(self, info, download=True):
+        if not download:
+            return info
+        caminho = self.prepare_filename(info)
+        os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        parcial = caminho + '.part'
+        
+        with urllib.request.urlopen(info['url'], timeout=30) as resposta, open(parcial, 'wb') as f:
+            total = int(resposta.headers.get('Content-Length') or 0)
+            baixados = 0
+            while True:
+                bloco = resposta.read(BLOCO)
+                if not bloco:
+                    break
+                f.write(bloco)
+                baixados += len(bloco)
+                self._progresso('downloading', parcial, caminho, baixados, total)
+        os.replace(parcial, caminho)
+        self._progresso('finished', parcial, caminho, baixados, total)
+        
+        info = dict(info, requested_downloads=[{'filepath': caminho}])
+        return info
+    
+    def _progresso(self, status, parcial, caminho, baixados, total):
+        for hook in self.params.get('progress_hooks') or []:
+            hook({'status': status, 'downloaded_bytes': baixados, 'total_bytes': total,
+                  'tmpfilename': parcial, 'filename': caminho, 'elapsed': time.monotonic()})
+    
+    def prepare_filename(self, info):
+        modelo = self.params.get('outtmpl') or '%(id)s.%(ext)s'
+        if isinstance(modelo, dict):
+            modelo = modelo.get('default', '%(id)s.%(ext)s')
+        return modelo % info
+    
+    @staticmethod
+    def sanitize_info(info, remove_private_keys=False):
+        return info
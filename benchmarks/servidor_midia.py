@@ -0,0 +1,53 @@
+"""Servidor HTTP local que entrega mídia sintética para os benchmarks
+
+Qualquer caminho devolve o mesmo conteúdo, com suporte a Range e, se
+pedido, velocidade limitada por conexão (como o YouTube faz).
+"""
+import http.server
+import re
+import threading
+import time
+
+BLOCO_ENVIO = 64 * 1024
+
+
+def criar_servidor(conteudo, velocidade_conexao=None):
+    """Sobe o servidor em 127.0.0.1 numa porta livre; use servidor.url e servidor.shutdown()"""
+    
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        
+        def log_message(self, *args):
+            pass
+        
+        def do_GET(self):
+            total = len(conteudo)
+            inicio, fim = 0, total - 1
+            intervalo = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+            if intervalo:
+                inicio = int(intervalo.group(1))
+                fim = min(int(intervalo.group(2) or total - 1), total - 1)
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {inicio}-{fim}/{total}')
+            else:
+                self.send_response(200)
+            self.send_header('Content-Length', str(fim - inicio + 1))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.end_headers()
+            
+            comeco = time.monotonic()
+            enviados = 0
+            for posicao in range(inicio, fim + 1, BLOCO_ENVIO):
+                bloco = conteudo[posicao:min(posicao + BLOCO_ENVIO, fim + 1)]
+                self.wfile.write(bloco)
+                enviados += len(bloco)
+                if velocidade_conexao:
+                    atraso = enviados / velocidade_conexao - (time.monotonic() - comeco)
+                    if atraso > 0:
+                        time.sleep(atraso)
+    
+    servidor = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    servidor.daemon_threads = True
+    servidor.url = f'http://127.0.0.1:{servidor.server_address[1]}'
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
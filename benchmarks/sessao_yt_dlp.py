@@ -0,0 +1,73 @@
+"""Mede o custo por item de criar um YoutubeDL novo versus reusar a SessaoDownload
+
+Uso:
+    python benchmarks/sessao_yt_dlp.py [--itens 500] [--url URL_DE_UM_VIDEO] [--saida resultado.json]
+
+Sem --url mede só a criação/encerramento das instâncias (sem rede). Com --url,
+também executa extract_info(download=False) --itens vezes em cada modo, o que
+inclui handshake TLS e inicialização dos extratores a cada instância nova.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+OPCOES = {'quiet': True, 'no_warnings': True, 'skip_download': True}
+
+
+def medir_instancia_por_item(itens, url=None):
+    import yt_dlp
+    
+    inicio = time.perf_counter()
+    for _ in range(itens):
+        with yt_dlp.YoutubeDL(OPCOES) as ydl:
+            if url:
+                ydl.extract_info(url, download=False)
+    return time.perf_counter() - inicio
+
+
+def medir_sessao(itens, url=None):
+    from core import SessaoDownload
+    
+    sessao = SessaoDownload()
+    inicio = time.perf_counter()
+    try:
+        for _ in range(itens):
+            ydl = sessao.ydl('benchmark', OPCOES)
+            if url:
+                ydl.extract_info(url, download=False)
+    finally:
+        sessao.fechar()
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--itens', type=int, default=500)
+    parser.add_argument('--url', help='vídeo usado para medir extract_info (usa a rede)')
+    parser.add_argument('--saida', help='arquivo JSON para gravar o resultado')
+    args = parser.parse_args()
+    
+    por_item = medir_instancia_por_item(args.itens, args.url)
+    sessao = medir_sessao(args.itens, args.url)
+    
+    resultado = {
+        'itens': args.itens,
+        'com_rede': bool(args.url),
+        'instancia_por_item_s': round(por_item, 4),
+        'sessao_reutilizada_s': round(sessao, 4),
+        'overhead_removido_por_item_ms': round((por_item - sessao) / args.itens * 1000, 3),
+    }
+    
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    print(texto)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+
+
+if __name__ == '__main__':
+    main()
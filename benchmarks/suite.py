@@ -0,0 +1,294 @@
+"""Benchmarks offline: playlists, vídeos, cópias do cache e índice do cache
+
+Uso:
+    python benchmarks/suite.py [--tamanhos 10 100 1000 10000] [--workers 1 4 16]
+                               [--videos 20] [--tamanho-kb 16] [--saida resultado.json]
+
+Nada vai à internet: o yt_dlp é trocado por benchmarks/falso/yt_dlp.py e a
+mídia vem de um servidor HTTP local (servidor_midia.py). Cada cenário roda em
+um processo separado com a própria pasta de dados (YOUTUBE_DOWNLOADER_PASTA):
+"frio" é uma pasta vazia e "quente" é a mesma pasta numa segunda execução,
+com o índice lido do disco como numa reabertura do app. Os arquivos
+sintéticos não são áudio, então o FFmpeg fica desligado e a conversão para
+MP3 não entra nas medidas.
+
+O resultado (JSON) traz, para cada cenário, o tempo total, itens por segundo
+e milissegundos por item, para comparar execuções e achar regressões.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PASTA_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(PASTA_BENCHMARKS)
+PASTA_FALSO = os.path.join(PASTA_BENCHMARKS, 'falso')
+
+
+def _medidas(segundos, itens, **extras):
+    return {
+        'segundos': round(segundos, 4),
+        'itens': itens,
+        'itens_por_segundo': round(itens / segundos, 1) if segundos > 0 else None,
+        'ms_por_item': round(segundos * 1000 / itens, 3) if itens else None,
+        **extras,
+    }
+
+
+# Cenários: rodam no processo filho, com o yt_dlp falso no sys.path
+
+def _preparar_core():
+    import core
+    # O conteúdo sintético não é áudio de verdade
+    core.verificar_ffmpeg = lambda: False
+    
+    class ObservadorSilencioso(core.ObservadorJob):
+        def log(self, mensagem):
+            pass
+    
+    return core, ObservadorSilencioso()
+
+
+def cenario_playlist(parametros):
+    core, observador = _preparar_core()
+    itens = parametros['itens']
+    url = f"https://www.youtube.com/playlist?list=PL{itens}_bench"
+    
+    inicio = time.perf_counter()
+    resultado = core.download_playlist(url, 'bench', parametros['workers'], observador=observador)
+    segundos = time.perf_counter() - inicio
+    return _medidas(segundos, itens, baixados=resultado.get('baixados'), copiados=resultado.get('copiados'),
+                    erros=resultado.get('erros'))
+
+
+def cenario_video(parametros):
+    core, observador = _preparar_core()
+    quantidade = parametros['quantidade']
+    sessao = core.SessaoDownload(core.Metricas())
+    
+    do_cache = erros = 0
+    inicio = time.perf_counter()
+    try:
+        for i in range(quantidade):
+            resultado = core.download_video({'id': f'vid{i:08d}', 'title': f'Vídeo {i}'}, parametros['formato'],
+                                            sessao, observador)
+            do_cache += bool(resultado['do_cache'])
+            erros += not resultado['sucesso']
+    finally:
+        sessao.fechar()
+    segundos = time.perf_counter() - inicio
+    return _medidas(segundos, quantidade, do_cache=do_cache, erros=erros)
+
+
+def _popular_cache(core, itens, tamanho):
+    """Cria itens arquivos em cache/musicas e o índice correspondente (fora da medição)"""
+    conteudo = os.urandom(tamanho)
+    pasta = os.path.join(core.criar_estrutura_pastas(), 'cache', 'musicas')
+    cache = {}
+    for i in range(itens):
+        video_hash = core.gerar_id_video(f'c{i:010d}')
+        arquivo = os.path.join(pasta, f'{video_hash}.m4a')
+        with open(arquivo, 'wb') as f:
+            f.write(conteudo)
+        cache[video_hash] = {
+            'id': f'c{i:010d}', 'title': f'Faixa {i}', 'formato': 'm4a', 'arquivo_cache': arquivo,
+            'tipo': 'playlist', 'ultimo_acesso': time.time(), 'acessos': 1,
+            'tamanho': tamanho, 'mtime': os.path.getmtime(arquivo), 'checksum': None,
+        }
+    core.salvar_cache(cache)
+    return core.carregar_cache(recarregar=True)
+
+
+def cenario_copia(parametros):
+    core, _ = _preparar_core()
+    cache = _popular_cache(core, parametros['itens'], parametros['tamanho'])
+    destino = os.path.join(core.criar_estrutura_pastas(), 'playlists', 'bench')
+    os.makedirs(destino, exist_ok=True)
+    
+    metodos = {}
+    inicio = time.perf_counter()
+    for video_hash, entrada in list(cache.items()):
+        metodo = core.copiar_do_cache(video_hash, entrada['title'], destino, cache, parametros['modo'])
+        metodos[metodo or 'erro'] = metodos.get(metodo or 'erro', 0) + 1
+    segundos = time.perf_counter() - inicio
+    return _medidas(segundos, parametros['itens'], metodos=metodos)
+
+
+def cenario_indice(parametros):
+    core, _ = _preparar_core()
+    itens = parametros['itens']
+    cache = {
+        core.gerar_id_video(f'i{i:010d}'): {
+            'id': f'i{i:010d}', 'title': f'Faixa {i}', 'formato': 'm4a',
+            'arquivo_cache': f'/cache/musicas/{i:010d}.m4a', 'tipo': 'playlist',
+            'ultimo_acesso': time.time(), 'acessos': 1, 'tamanho': 4_000_000,
+            'mtime': time.time(), 'checksum': '0' * 32,
+        }
+        for i in range(itens)
+    }
+    cache_file, journal_file = core._caminhos_cache()
+    
+    inicio = time.perf_counter()
+    core.salvar_cache(cache)
+    salvar = time.perf_counter() - inicio
+    
+    inicio = time.perf_counter()
+    cache = core.carregar_cache(recarregar=True)
+    carregar = time.perf_counter() - inicio
+    
+    # Alterações isoladas (uma linha de journal cada), sem chegar à compactação
+    registros = min(itens, core.JOURNAL_LIMITE_COMPACTACAO - 2)
+    chaves = list(cache)[:registros]
+    inicio = time.perf_counter()
+    for chave in chaves:
+        core.registrar_no_cache(cache, chave, dict(cache[chave], acessos=2))
+    registrar = time.perf_counter() - inicio
+    
+    inicio = time.perf_counter()
+    cache = core.carregar_cache(recarregar=True)
+    carregar_com_journal = time.perf_counter() - inicio
+    
+    # Estatísticas de inicialização sem o índice em memória
+    core._cache_memoria = None
+    core._contadores_memoria = None
+    inicio = time.perf_counter()
+    core.contadores_cache()
+    contadores = time.perf_counter() - inicio
+    
+    return _medidas(salvar + carregar, itens,
+                    salvar_cache_s=round(salvar, 4),
+                    carregar_cache_s=round(carregar, 4),
+                    carregar_cache_com_journal_s=round(carregar_com_journal, 4),
+                    registros_journal=registros,
+                    ms_por_registro_journal=round(registrar * 1000 / registros, 3) if registros else None,
+                    contadores_sem_indice_s=round(contadores, 5),
+                    snapshot_bytes=os.path.getsize(cache_file),
+                    journal_bytes=os.path.getsize(journal_file))
+
+
+CENARIOS = {
+    'playlist': cenario_playlist,
+    'video': cenario_video,
+    'copia': cenario_copia,
+    'indice': cenario_indice,
+}
+
+
+def executar_interno(nome, parametros):
+    # Mensagens do core vão para a saída de erro; a saída padrão é só do JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        resultado = CENARIOS[nome](parametros)
+    print(json.dumps(resultado))
+
+
+# Orquestração: roda no processo principal
+
+def executar_cenario(nome, parametros, pasta, servidor):
+    ambiente = dict(os.environ, YOUTUBE_DOWNLOADER_PASTA=pasta, BENCH_SERVIDOR=servidor.url)
+    ambiente['PYTHONPATH'] = os.pathsep.join(filter(None, [PASTA_FALSO, RAIZ, os.environ.get('PYTHONPATH')]))
+    processo = subprocess.run([sys.executable, os.path.abspath(__file__), '--interno', nome, json.dumps(parametros)],
+                              env=ambiente, capture_output=True, text=True)
+    
+    registro = {'cenario': nome, **parametros}
+    if processo.returncode != 0:
+        registro['erro'] = processo.stderr.strip()[-1000:]
+    else:
+        registro.update(json.loads(processo.stdout.strip().splitlines()[-1]))
+    
+    resumo = registro.get('erro') or f"{registro['segundos']}s, {registro['ms_por_item']} ms/item"
+    print(f"{nome} {json.dumps(parametros)}: {resumo}", file=sys.stderr, flush=True)
+    return registro
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['--interno']:
+        executar_interno(argv[1], json.loads(argv[2]))
+        return
+    
+    parser = argparse.ArgumentParser(description='Benchmarks offline do YouTube Downloader')
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                        help='quantidade de itens das playlists e do cache')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16], help='downloads simultâneos')
+    parser.add_argument('--videos', type=int, default=20, help='vídeos individuais por cenário')
+    parser.add_argument('--tamanho-kb', type=int, default=16, help='tamanho de cada arquivo sintético')
+    parser.add_argument('--cenarios', nargs='+', choices=sorted(CENARIOS), default=sorted(CENARIOS))
+    parser.add_argument('--saida', help='grava o resultado JSON neste arquivo')
+    args = parser.parse_args(argv)
+    
+    from servidor_midia import criar_servidor
+    
+    tamanho = args.tamanho_kb * 1024
+    servidor = criar_servidor(os.urandom(tamanho))
+    raiz_temporaria = tempfile.mkdtemp(prefix='bench_yt_down_')
+    resultados = []
+    
+    def _pasta(nome):
+        caminho = os.path.join(raiz_temporaria, nome)
+        shutil.rmtree(caminho, ignore_errors=True)
+        return caminho
+    
+    try:
+        if 'playlist' in args.cenarios:
+            for itens in args.tamanhos:
+                for workers in args.workers:
+                    pasta = _pasta('playlist')
+                    for estado in ('frio', 'quente'):
+                        resultados.append(executar_cenario(
+                            'playlist', {'itens': itens, 'workers': workers, 'estado': estado}, pasta, servidor))
+        
+        if 'video' in args.cenarios:
+            for formato in ('mp3', 'mp4'):
+                pasta = _pasta('video')
+                for estado in ('frio', 'quente'):
+                    resultados.append(executar_cenario(
+                        'video', {'quantidade': args.videos, 'formato': formato, 'estado': estado}, pasta, servidor))
+        
+        if 'copia' in args.cenarios:
+            for itens in args.tamanhos:
+                for modo in ('auto', 'copia'):
+                    resultados.append(executar_cenario(
+                        'copia', {'itens': itens, 'modo': modo, 'tamanho': tamanho}, _pasta('copia'), servidor))
+        
+        if 'indice' in args.cenarios:
+            for itens in args.tamanhos:
+                resultados.append(executar_cenario('indice', {'itens': itens}, _pasta('indice'), servidor))
+    finally:
+        servidor.shutdown()
+        shutil.rmtree(raiz_temporaria, ignore_errors=True)
+    
+    relatorio = {
+        'ambiente': {
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count(),
+            'commit': _commit_atual(),
+            'data': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'parametros': {'tamanho_arquivo_bytes': tamanho, 'tamanhos': args.tamanhos, 'workers': args.workers,
+                       'videos': args.videos},
+        'cenarios': resultados,
+    }
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+    print(texto)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ package.name = youtubedownloader
 package.domain = org.ytdl
 source.dir = .
 source.include_exts = py
+source.exclude_dirs = benchmarks
 version = 2.0
 requirements = python3,kivy,yt-dlp,android
 orientation = portrait
@@ -0,0 +1,106 @@
+"""Execução sem interface: baixa uma lista de URLs e escreve um resultado JSON por URL
+
+Uso:
+    python cli.py urls.txt [--formato mp3|mp4] [--workers N] [--jobs N] [--copias]
+                           [--sincronizar] [--remover-ausentes] [--saida resultados.jsonl]
+
+Cada linha do arquivo (ou da entrada padrão, com "-") tem uma URL e, opcionalmente,
+o nome da pasta da playlist separado por espaço. Linhas vazias e começadas por #
+são ignoradas. As URLs passam pelo mesmo Escalonador da interface (sem gravar a
+fila em disco): até --jobs rodam juntas dividindo os --workers, e um vídeo que
+aparece em duas playlists é baixado uma vez só. Os resultados saem na ordem em
+que os trabalhos terminam. Retentativas pendentes de execuções anteriores
+rodam depois delas. Não importa o Kivy; o yt-dlp só é carregado no
+primeiro download.
+"""
+import argparse
+import json
+import sys
+import threading
+
+import core
+
+
+class ObservadorCLI(core.ObservadorJob):
+    """Escreve o log do job na saída de erro, deixando a saída padrão só para o JSON"""
+    
+    def __init__(self, silencioso=False):
+        self.silencioso = silencioso
+    
+    def log(self, mensagem):
+        if not self.silencioso:
+            print(core.remover_markup(mensagem), file=sys.stderr, flush=True)
+
+
+def ler_urls(arquivo):
+    """Lê (url, nome) de cada linha útil do arquivo"""
+    entrada = sys.stdin if arquivo == '-' else open(arquivo, 'r', encoding='utf-8')
+    try:
+        for linha in entrada:
+            linha = linha.strip()
+            if not linha or linha.startswith('#'):
+                continue
+            partes = linha.split(None, 1)
+            yield partes[0], partes[1].strip() if len(partes) > 1 else None
+    finally:
+        if entrada is not sys.stdin:
+            entrada.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='YouTube Downloader sem interface')
+    parser.add_argument('arquivo', help='arquivo com uma URL por linha ("-" para a entrada padrão)')
+    parser.add_argument('--formato', choices=('mp3', 'mp4'), default='mp3', help='formato dos vídeos individuais')
+    parser.add_argument('--workers', type=int, default=core.NUM_WORKERS_PADRAO, help='downloads simultâneos')
+    parser.add_argument('--jobs', type=int, default=core.JOBS_SIMULTANEOS, help='URLs processadas ao mesmo tempo')
+    parser.add_argument('--nome', default='minha_playlist', help='pasta das playlists sem nome no arquivo')
+    parser.add_argument('--copias', action='store_true', help='copiar os arquivos em vez de usar links')
+    parser.add_argument('--sincronizar', action='store_true')
+    parser.add_argument('--remover-ausentes', action='store_true')
+    parser.add_argument('--saida', help='grava os resultados (JSON Lines) neste arquivo em vez da saída padrão')
+    parser.add_argument('--silencioso', action='store_true', help='não escreve o log na saída de erro')
+    args = parser.parse_args(argv)
+    
+    num_workers = core.normalizar_num_workers(args.workers)
+    modo = core.MATERIALIZACAO_COPIA if args.copias else core.MATERIALIZACAO_AUTO
+    observador = ObservadorCLI(args.silencioso)
+    saida = open(args.saida, 'w', encoding='utf-8') if args.saida else sys.stdout
+    
+    erros = 0
+    saida_lock = threading.Lock()
+    
+    def _concluido(trabalho, resultado):
+        nonlocal erros
+        with saida_lock:
+            if not resultado.get('sucesso'):
+                erros += 1
+            saida.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+            saida.flush()
+    
+    escalonador = core.Escalonador(num_workers, max(1, args.jobs), persistir=False,
+                                   observador_para=lambda trabalho: observador, ao_concluir=_concluido)
+    try:
+        for url, nome in ler_urls(args.arquivo):
+            url, aviso = core.preparar_url(url)
+            if aviso:
+                observador.log(aviso)
+            escalonador.adicionar(url, nome or args.nome, args.formato, modo=modo,
+                                  sincronizar=args.sincronizar, remover_ausentes=args.remover_ausentes)
+        escalonador.iniciar()
+        escalonador.aguardar()
+        
+        # Downloads que ficaram pendentes em execuções anteriores, depois das URLs pedidas
+        if core.carregar_fila_retentativas():
+            core.processar_fila_retentativas(core.carregar_cache(), core.verificar_ffmpeg(), observador.log,
+                                             escalonador.pool)
+    finally:
+        escalonador.encerrar()
+        if saida is not sys.stdout:
+            saida.close()
+        core.liberar_espaco_cache(core.carregar_cache())
+    
+    return 1 if erros else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,3187 @@
+"""Núcleo do YouTube Downloader: cache, downloads e jobs, sem dependência do Kivy
+
+Usado pela interface (main.py) e pela execução sem interface (cli.py). O yt-dlp
+só é importado quando um download ou extração realmente acontece.
+"""
+import os
+import sys
+import shutil
+import subprocess
+import json
+import re
+import hashlib
+import threading
+import time
+import random
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+# Variável de ambiente que escolhe a pasta de dados (playlists/ e cache/)
+PASTA_BASE_VARIAVEL = 'YOUTUBE_DOWNLOADER_PASTA'
+
+# Quantidade padrão de downloads simultâneos em playlists
+NUM_WORKERS_PADRAO = 4
+NUM_WORKERS_MAXIMO = 16
+
+# Estados de cada item da playlist durante o processamento
+ESTADO_NA_FILA = 'na_fila'
+ESTADO_BAIXANDO = 'baixando'
+ESTADO_CONVERTENDO = 'convertendo'
+ESTADO_COPIANDO = 'copiando'
+ESTADO_CONCLUIDO = 'concluido'
+ESTADO_FALHOU = 'falhou'
+
+# Índice do cache: um snapshot JSON compactado periodicamente e um journal
+# (uma linha JSON por alteração) com as mudanças feitas desde o snapshot
+CACHE_ARQUIVO = 'downloaded_tracks.json'
+CACHE_JOURNAL = 'downloaded_tracks.journal'
+JOURNAL_LIMITE_COMPACTACAO = 500
+# Itens e bytes por tipo gravados a cada compactação; com o journal, dão as
+# estatísticas do cache sem carregar o índice inteiro
+CACHE_CONTADORES = 'downloaded_tracks.contadores.json'
+
+# Protege o dicionário do cache, o snapshot e o journal contra escritas simultâneas
+_cache_lock = threading.RLock()
+_cache_memoria = None
+_contadores_memoria = None
+_journal_linhas = 0
+
+# Verificação de integridade dos arquivos do cache, em segundo plano
+CHECKSUM_BLOCO = 1024 * 1024
+# Cada arquivo é conferido no máximo uma vez por intervalo
+VERIFICACAO_CACHE_INTERVALO = 7 * 24 * 60 * 60
+VERIFICACAO_CACHE_ATRASO_INICIAL = 60
+VERIFICACAO_CACHE_REPETICAO = 6 * 60 * 60
+VERIFICACAO_CACHE_BYTES_POR_SEGUNDO = 8 * 1024 * 1024
+
+_verificacao_thread = None
+
+# Como os arquivos do cache são colocados nas pastas das playlists:
+# 'auto' tenta reflink, hardlink e symlink antes de copiar; 'copia' sempre copia
+MATERIALIZACAO_AUTO = 'auto'
+MATERIALIZACAO_COPIA = 'copia'
+METODOS_MATERIALIZACAO = ('reflink', 'hardlink', 'symlink', 'copia')
+
+# Fila persistente de downloads que falharam por erros temporários (403, timeout, etc.)
+FILA_RETENTATIVAS_ARQUIVO = 'fila_retentativas.json'
+RETENTATIVA_ESPERA_BASE = 30
+RETENTATIVA_ESPERA_MAXIMA = 6 * 60 * 60
+RETENTATIVAS_MAXIMAS = 8
+# Novas tentativas dentro do próprio job, antes de deixar o item para a fila
+RETENTATIVAS_NO_JOB = 2
+RETENTATIVA_NO_JOB_ESPERA_BASE = 5
+ERROS_PERMANENTES = ('unavailable', 'private', 'copyright', 'removed', 'members-only', 'not available')
+
+_fila_lock = threading.Lock()
+_retentativas_thread = None
+# PoolDownloads usado pelas retentativas em segundo plano (ver iniciar_retentativas_pendentes)
+_retentativas_pool = None
+
+# Fila persistente de trabalhos (URLs enfileiradas pelo usuário) e quantos rodam juntos
+FILA_TRABALHOS_ARQUIVO = 'fila_trabalhos.json'
+JOBS_SIMULTANEOS = 2
+PRIORIDADE_NORMAL = 0
+PRIORIDADE_ALTA = 10
+# Trabalhos finalizados mantidos no arquivo da fila (os mais recentes)
+TRABALHOS_FINALIZADOS_MAXIMO = 50
+
+# Estados de um trabalho da fila
+TRABALHO_NA_FILA = 'na_fila'
+TRABALHO_EXECUTANDO = 'executando'
+TRABALHO_PAUSADO = 'pausado'
+TRABALHO_CANCELADO = 'cancelado'
+TRABALHO_CONCLUIDO = 'concluido'
+TRABALHO_FALHOU = 'falhou'
+TRABALHOS_FINALIZADOS = (TRABALHO_CANCELADO, TRABALHO_CONCLUIDO, TRABALHO_FALHOU)
+
+# Downloads em andamento em qualquer job: video_hash -> Future com (sucesso, erro)
+_downloads_em_andamento = {}
+_downloads_lock = threading.Lock()
+
+
+# Estatísticas do job atual em formato JSON, para ajustar a concorrência com dados reais
+ESTATISTICAS_ARQUIVO = 'estatisticas.json'
+# Com o Escalonador, cada trabalho grava as suas em estatisticas/<id>.json
+ESTATISTICAS_PASTA = 'estatisticas'
+ESTATISTICAS_INTERVALO_GRAVACAO = 2.0
+
+# Rastreamento por etapas (ver Rastreamento), gravado em cache/rastreamentos no
+# formato de eventos do Chrome (chrome://tracing, Perfetto)
+RASTREAMENTOS_PASTA = 'rastreamentos'
+RASTREAMENTOS_MAXIMO = 20
+RASTREAMENTO_MAIS_LENTOS = 5
+
+# Configurações opcionais lidas de YouTubeDownloader/configuracoes.json
+CONFIGURACOES_ARQUIVO = 'configuracoes.json'
+CONFIGURACOES_PADRAO = {
+    # Limites do cache em bytes (None = sem limite), por pasta e no total
+    'limite_cache_total': None,
+    'limites_cache': {
+        'musicas': None,
+        'videos_individuais_mp3': None,
+        'videos_individuais_mp4': None,
+    },
+    # 'lru' (menos recentemente usado) ou 'lfu' (menos usado)
+    'politica_cache': 'lru',
+    'intervalo_limpeza_cache': 30 * 60,
+    # Banda máxima em bytes/s somando todos os downloads (None = sem limite)
+    'limite_banda': None,
+    # Reduz/aumenta os downloads simultâneos e o ritmo de requisições conforme
+    # bloqueios e lentidão observados (ver ControleAdaptativo)
+    'concorrencia_adaptativa': True,
+    # Conexões usadas por vídeo individual em MP4 (1 = uma conexão, como antes)
+    'conexoes_por_video': 1,
+    # Grava as etapas de cada job (extract_info, rede, FFmpeg, cópias, índice)
+    # em cache/rastreamentos e mostra as mais lentas ao final
+    'rastreamento': False,
+}
+
+# Download de um MP4 em várias conexões: o arquivo é dividido em partes que as
+# conexões vão pegando em ordem, lidas em blocos (memória = conexões x bloco)
+DOWNLOAD_PARTE_TAMANHO = 4 * 1024 * 1024
+DOWNLOAD_BLOCO = 256 * 1024
+DOWNLOAD_TIMEOUT = 30
+
+# Controle adaptativo (AIMD) da concorrência e do ritmo de requisições
+ERROS_BLOQUEIO = ('403', '429', 'forbidden', 'too many requests', 'timed out')
+# Downloads abaixo dessa velocidade indicam que o YouTube está estrangulando a conexão
+VELOCIDADE_ESTRANGULADA = 64 * 1024
+# Downloads menores que isso não servem para medir velocidade
+AIMD_BYTES_MINIMOS = 1024 * 1024
+# Sinais de congestionamento dentro deste intervalo contam como um só corte
+AIMD_CARENCIA_CORTE = 10.0
+AIMD_INTERVALO_BASE = 1.0
+AIMD_INTERVALO_MAXIMO = 60.0
+AIMD_PASSO_INTERVALO = 0.25
+
+# Arquivos usados há menos tempo que isso nunca são removidos (podem estar em uso)
+LIMPEZA_CACHE_CARENCIA = 10 * 60
+
+_limpeza_evento = threading.Event()
+_limpeza_thread = None
+
+# Manifesto de cada pasta de playlist: o que já foi colocado lá (id, arquivo, tamanho, mtime)
+MANIFESTO_ARQUIVO = '.manifesto.json'
+# Um lock por pasta: jobs com o mesmo nome e a fila de retentativas gravam no mesmo manifesto
+_manifestos_locks = {}
+_manifestos_lock = threading.Lock()
+
+# Cache de metadados do yt-dlp (resultado de extract_info), por URL normalizada
+METADADOS_ARQUIVO = 'metadados.json'
+METADADOS_TTL = 6 * 60 * 60
+METADADOS_MAX_ENTRADAS = 200
+# Playlists maiores que isso não são guardadas no cache de metadados
+METADADOS_MAX_ITENS_PLAYLIST = 5000
+# Únicos campos lidos do info (e de cada item de 'entries'); formatos, legendas
+# e miniaturas ocupariam centenas de KB por entrada
+METADADOS_CAMPOS = ('_type', 'id', 'title', 'playlist_count')
+METADADOS_CAMPOS_ITEM = ('id', 'title')
+
+_metadados_lock = threading.Lock()
+_metadados_memoria = None
+
+# (valor de YOUTUBE_DOWNLOADER_PASTA, pasta base) resolvido por criar_estrutura_pastas
+_pasta_base = None
+
+# Métodos que já falharam para um par (dispositivo de origem, dispositivo de destino)
+_metodos_indisponiveis = {}
+_metodos_lock = threading.Lock()
+
+# Rastreamento ativo na thread atual: (Rastreamento, contexto) ou None
+class _RastreamentoLocal(threading.local):
+    atual = None
+
+_rastreamento_local = _RastreamentoLocal()
+
+def verificar_ffmpeg():
+    """Verifica se o FFmpeg está instalado no sistema"""
+    return shutil.which("ffmpeg") is not None
+
+def obter_caminho_base():
+    """Retorna o caminho base onde o script está localizado"""
+    if hasattr(sys, '_MEIPASS'):
+        return sys._MEIPASS
+    
+    script_path = os.path.dirname(os.path.abspath(__file__))
+    return script_path
+
+def criar_estrutura_pastas():
+    """Cria a estrutura de pastas assets/playlists e assets/cache
+    
+    A variável de ambiente YOUTUBE_DOWNLOADER_PASTA, se definida, substitui a pasta
+    padrão (servidores, benchmarks). A pasta é resolvida (e as permissões do
+    Android pedidas) uma vez por processo; as chamadas seguintes, feitas a
+    cada gravação do journal, só retornam o caminho guardado.
+    """
+    global _pasta_base
+    
+    variavel = os.environ.get(PASTA_BASE_VARIAVEL)
+    if _pasta_base is not None and _pasta_base[0] == variavel:
+        return _pasta_base[1]
+    
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    base_dir = os.environ.get(PASTA_BASE_VARIAVEL) or os.path.join(script_dir, 'YouTubeDownloader')
+    
+    # Em Android, tenta usar storage externo se disponível
+    if not os.environ.get(PASTA_BASE_VARIAVEL):
+        try:
+            from android.storage import primary_external_storage_path
+            from android.permissions import request_permissions, Permission
+            request_permissions([
+                Permission.WRITE_EXTERNAL_STORAGE, 
+                Permission.READ_EXTERNAL_STORAGE,
+                Permission.INTERNET
+            ])
+            
+            storage_path = primary_external_storage_path()
+            base_dir = os.path.join(storage_path, 'YouTubeDownloader')
+        except:
+            pass
+    
+    pastas = [
+        base_dir,
+        os.path.join(base_dir, 'playlists'),
+        os.path.join(base_dir, 'cache', 'musicas'),
+        os.path.join(base_dir, 'cache', 'staging'),
+        os.path.join(base_dir, 'cache', 'videos_individuais_mp3'),
+        os.path.join(base_dir, 'cache', 'videos_individuais_mp4')
+    ]
+    
+    for pasta in pastas:
+        try:
+            if not os.path.exists(pasta):
+                os.makedirs(pasta)
+        except Exception as e:
+            print(f"Erro ao criar pasta {pasta}: {e}")
+    
+    _pasta_base = (variavel, base_dir)
+    return base_dir
+
+def carregar_configuracoes():
+    """Lê configuracoes.json (se existir) sobre os valores de CONFIGURACOES_PADRAO"""
+    configuracoes = json.loads(json.dumps(CONFIGURACOES_PADRAO))
+    try:
+        caminho = os.path.join(criar_estrutura_pastas(), CONFIGURACOES_ARQUIVO)
+        if os.path.exists(caminho):
+            with open(caminho, 'r', encoding='utf-8') as f:
+                for chave, valor in json.load(f).items():
+                    if isinstance(valor, dict) and isinstance(configuracoes.get(chave), dict):
+                        configuracoes[chave].update(valor)
+                    else:
+                        configuracoes[chave] = valor
+    except Exception as e:
+        print(f"Erro ao carregar configurações: {e}")
+    return configuracoes
+
+def _caminhos_cache():
+    """Retorna os caminhos do snapshot e do journal do cache"""
+    base_path = criar_estrutura_pastas()
+    pasta_cache = os.path.join(base_path, 'cache')
+    return os.path.join(pasta_cache, CACHE_ARQUIVO), os.path.join(pasta_cache, CACHE_JOURNAL)
+
+def _caminho_contadores():
+    return os.path.join(criar_estrutura_pastas(), 'cache', CACHE_CONTADORES)
+
+def _resumo_contador(entrada):
+    """O que os contadores precisam de uma entrada (gravado no journal junto da alteração)"""
+    if not entrada:
+        return None
+    return {'tipo': entrada.get('tipo'), 'tamanho': entrada.get('tamanho')}
+
+def _somar_contador(contadores, entrada, sinal):
+    if not entrada:
+        return
+    contador = contadores.setdefault(entrada.get('tipo') or 'desconhecido', {'itens': 0, 'bytes': 0})
+    contador['itens'] += sinal
+    contador['bytes'] += sinal * (entrada.get('tamanho') or 0)
+
+def _calcular_contadores(cache):
+    contadores = {}
+    for entrada in cache.values():
+        _somar_contador(contadores, entrada, 1)
+    return contadores
+
+def _escrever_json_atomico(caminho, dados):
+    """Grava um JSON em arquivo temporário e o renomeia, para nunca deixar o arquivo pela metade"""
+    # Nome por thread: duas threads podem gravar o mesmo arquivo ao mesmo tempo
+    temporario = f'{caminho}.{threading.get_ident()}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, caminho)
+
+def _aplicar_journal(cache, journal_file):
+    """Reaplica as alterações do journal sobre o snapshot e retorna quantas linhas foram lidas
+    
+    Uma última linha sem quebra (gravação interrompida) é cortada do arquivo,
+    para que a próxima alteração não seja emendada nela.
+    """
+    linhas = 0
+    with open(journal_file, 'rb+') as f:
+        dados = f.read()
+        completo = dados.rfind(b'\n') + 1
+        if completo < len(dados):
+            f.truncate(completo)
+            f.flush()
+            os.fsync(f.fileno())
+    
+    for linha in dados[:completo].decode('utf-8', 'replace').splitlines():
+        try:
+            registro = json.loads(linha)
+        except ValueError:
+            continue
+        linhas += 1
+        if registro.get('op') == 'set':
+            cache[registro['chave']] = registro['valor']
+        elif registro.get('op') == 'del':
+            cache.pop(registro['chave'], None)
+        elif registro.get('op') == 'acesso' and registro['chave'] in cache:
+            _marcar_acesso(cache[registro['chave']], registro['t'])
+    return linhas
+
+def carregar_cache(recarregar=False):
+    """Carrega o histórico de downloads (snapshot JSON + journal)
+    
+    O índice é lido do disco uma única vez por processo; as chamadas seguintes
+    retornam o mesmo dicionário, que é mantido atualizado por registrar_no_cache.
+    Um downloaded_tracks.json de versões anteriores é lido como snapshot.
+    """
+    global _cache_memoria, _contadores_memoria, _journal_linhas
+    
+    with _cache_lock:
+        if _cache_memoria is not None and not recarregar:
+            return _cache_memoria
+        
+        cache = {}
+        linhas = 0
+        try:
+            cache_file, journal_file = _caminhos_cache()
+            
+            if os.path.exists(cache_file):
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    cache = json.load(f)
+            
+            if os.path.exists(journal_file):
+                linhas = _aplicar_journal(cache, journal_file)
+        except Exception as e:
+            print(f"Erro ao carregar cache: {e}")
+        
+        _cache_memoria = cache
+        _contadores_memoria = _calcular_contadores(cache)
+        _journal_linhas = linhas
+        
+        if _journal_linhas >= JOURNAL_LIMITE_COMPACTACAO:
+            salvar_cache(cache)
+        
+        return cache
+
+def _registrar_journal(registro):
+    """Acrescenta uma alteração ao journal e compacta quando ele fica grande"""
+    global _journal_linhas
+    
+    _, journal_file = _caminhos_cache()
+    with open(journal_file, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(registro, ensure_ascii=False, separators=(',', ':')) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    
+    _journal_linhas += 1
+    if _journal_linhas >= JOURNAL_LIMITE_COMPACTACAO and _cache_memoria is not None:
+        salvar_cache(_cache_memoria)
+
+def registrar_no_cache(cache, video_hash, entrada):
+    """Adiciona (ou substitui) uma entrada no cache gravando apenas uma linha no journal"""
+    with rastrear('registrar_no_cache'), _cache_lock:
+        anterior = cache.get(video_hash)
+        cache[video_hash] = entrada
+        if cache is _cache_memoria:
+            _somar_contador(_contadores_memoria, anterior, -1)
+            _somar_contador(_contadores_memoria, entrada, 1)
+        try:
+            _registrar_journal({'op': 'set', 'chave': video_hash, 'valor': entrada,
+                                'anterior': _resumo_contador(anterior)})
+        except Exception as e:
+            print(f"Erro ao salvar cache: {e}")
+
+def _marcar_acesso(entrada, momento):
+    entrada['ultimo_acesso'] = momento
+    entrada['acessos'] = entrada.get('acessos', 0) + 1
+
+def registrar_acesso_cache(cache, video_hash):
+    """Anota que uma entrada do cache foi usada (base das políticas LRU/LFU)"""
+    with _cache_lock:
+        entrada = cache.get(video_hash)
+        if entrada is None:
+            return
+        momento = time.time()
+        _marcar_acesso(entrada, momento)
+        try:
+            _registrar_journal({'op': 'acesso', 'chave': video_hash, 't': momento})
+        except Exception as e:
+            print(f"Erro ao salvar cache: {e}")
+
+def remover_do_cache(cache, video_hash):
+    """Remove uma entrada do cache gravando apenas uma linha no journal"""
+    with _cache_lock:
+        anterior = cache.pop(video_hash, None)
+        if anterior is None:
+            return
+        if cache is _cache_memoria:
+            _somar_contador(_contadores_memoria, anterior, -1)
+        try:
+            _registrar_journal({'op': 'del', 'chave': video_hash, 'anterior': _resumo_contador(anterior)})
+        except Exception as e:
+            print(f"Erro ao salvar cache: {e}")
+
+def salvar_cache(cache):
+    """Compacta o cache: grava o snapshot completo de forma atômica e esvazia o journal
+    
+    Os contadores por tipo são gravados com um número de geração que também
+    abre o journal novo; contadores_cache() só confia neles se as gerações batem.
+    """
+    global _journal_linhas
+    
+    with _cache_lock, rastrear('salvar_cache', entradas=len(cache)):
+        try:
+            cache_file, journal_file = _caminhos_cache()
+            _escrever_json_atomico(cache_file, cache)
+            geracao = uuid.uuid4().hex
+            _escrever_json_atomico(_caminho_contadores(),
+                                   {'geracao': geracao, 'contadores': _calcular_contadores(cache)})
+            
+            # Se o app morrer antes daqui, o journal é apenas reaplicado sobre o
+            # snapshot novo, o que não altera o resultado
+            with open(journal_file, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'op': 'geracao', 'id': geracao}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            _journal_linhas = 0
+        except Exception as e:
+            print(f"Erro ao salvar cache: {e}")
+
+def _contadores_gravados():
+    """Contadores da última compactação mais as alterações do journal, ou None se não servirem"""
+    caminho = _caminho_contadores()
+    _, journal_file = _caminhos_cache()
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, 'r', encoding='utf-8') as f:
+        dados = json.load(f)
+    contadores = dados['contadores']
+    
+    geracao = None
+    if os.path.exists(journal_file):
+        with open(journal_file, 'r', encoding='utf-8') as f:
+            for linha in f:
+                try:
+                    registro = json.loads(linha)
+                except ValueError:
+                    continue
+                op = registro.get('op')
+                if op == 'geracao':
+                    geracao = registro['id']
+                elif op in ('set', 'del'):
+                    # Linha gravada por uma versão que não anotava a entrada anterior
+                    if 'anterior' not in registro:
+                        return None
+                    _somar_contador(contadores, registro['anterior'], -1)
+                    if op == 'set':
+                        _somar_contador(contadores, registro['valor'], 1)
+    
+    # Journal de outra geração: o app fechou no meio de uma compactação
+    if geracao != dados.get('geracao'):
+        return None
+    return contadores
+
+def contadores_cache():
+    """Itens e bytes do cache por tipo: {tipo: {'itens', 'bytes'}}
+    
+    Com o índice em memória, usa os contadores mantidos a cada alteração; senão
+    lê os da última compactação e aplica o journal, sem carregar o snapshot.
+    """
+    with _cache_lock:
+        if _contadores_memoria is not None:
+            return {tipo: dict(contador) for tipo, contador in _contadores_memoria.items()}
+    try:
+        contadores = _contadores_gravados()
+        if contadores is not None:
+            return contadores
+    except Exception as e:
+        print(f"Erro ao ler contadores do cache: {e}")
+    carregar_cache()
+    return contadores_cache()
+
+def calcular_checksum(caminho, limite_bps=None):
+    """Checksum (BLAKE2b) do arquivo lido em blocos, opcionalmente limitado a limite_bps"""
+    checksum = hashlib.blake2b(digest_size=16)
+    inicio = time.monotonic()
+    lidos = 0
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(CHECKSUM_BLOCO), b''):
+            checksum.update(bloco)
+            if limite_bps:
+                lidos += len(bloco)
+                atraso = lidos / limite_bps - (time.monotonic() - inicio)
+                if atraso > 0:
+                    time.sleep(atraso)
+    return checksum.hexdigest()
+
+def assinatura_arquivo(caminho):
+    """Tamanho, mtime e checksum de um arquivo do cache, guardados na entrada dele"""
+    info = os.stat(caminho)
+    with rastrear('checksum', bytes=info.st_size):
+        checksum = calcular_checksum(caminho)
+    return {'tamanho': info.st_size, 'mtime': info.st_mtime, 'checksum': checksum}
+
+def arquivo_valido(entrada):
+    """Indica se o arquivo da entrada existe e tem o tamanho registrado
+    
+    Entradas de versões anteriores, sem tamanho, só precisam existir. O
+    checksum fica para a verificação em segundo plano (verificar_cache).
+    """
+    arquivo = (entrada or {}).get('arquivo_cache')
+    if not arquivo:
+        return False
+    try:
+        tamanho = os.path.getsize(arquivo)
+    except OSError:
+        return False
+    return entrada.get('tamanho') is None or tamanho == entrada['tamanho']
+
+def entrada_atende(entrada, formato, ffmpeg_disponivel):
+    """Indica se a entrada do cache pode ser usada para um pedido em formato ('mp3' ou 'mp4')
+    
+    MP3 e M4A ficam na mesma chave (gerar_id_video(id, 'mp3')). Um M4A baixado
+    quando não havia FFmpeg não atende a um pedido de MP3 se o FFmpeg estiver
+    disponível: download_para_cache o converte localmente, sem ir à rede.
+    """
+    if not arquivo_valido(entrada):
+        return False
+    return not (formato == 'mp3' and ffmpeg_disponivel and entrada.get('formato') != 'mp3')
+
+def gerar_id_video(url_ou_id, formato='mp3'):
+    """Gera um ID único para o vídeo incluindo o formato"""
+    return hashlib.md5(f"{url_ou_id}_{formato}".encode()).hexdigest()
+
+def sanitizar_nome_arquivo(nome):
+    """Remove caracteres inválidos do nome do arquivo"""
+    caracteres_invalidos = '<>:"/\\|?*'
+    for char in caracteres_invalidos:
+        nome = nome.replace(char, '_')
+    return nome
+
+def normalizar_url(url):
+    """Gera a chave do cache de metadados a partir do ID da playlist/vídeo da URL"""
+    url = url.strip()
+    if '/clip/' in url:
+        clip_match = re.search(r'/clip/([a-zA-Z0-9_-]+)', url)
+        if clip_match:
+            return f"clip:{clip_match.group(1)}"
+    
+    lista_match = re.search(r'[?&]list=([a-zA-Z0-9_-]+)', url)
+    if lista_match and not lista_match.group(1).startswith(('RD', 'UL')):
+        return f"playlist:{lista_match.group(1)}"
+    
+    video_match = re.search(r'(?:v=|youtu\.be/|/shorts/)([a-zA-Z0-9_-]{11})', url)
+    if video_match:
+        return f"video:{video_match.group(1)}"
+    
+    return url.rstrip('/')
+
+def _caminho_metadados():
+    return os.path.join(criar_estrutura_pastas(), 'cache', METADADOS_ARQUIVO)
+
+def _carregar_metadados():
+    """Carrega (uma vez por processo) o cache de metadados, já na ordem LRU"""
+    global _metadados_memoria
+    
+    if _metadados_memoria is None:
+        _metadados_memoria = OrderedDict()
+        try:
+            caminho = _caminho_metadados()
+            if os.path.exists(caminho):
+                with open(caminho, 'r', encoding='utf-8') as f:
+                    _metadados_memoria.update(json.load(f))
+        except Exception as e:
+            print(f"Erro ao carregar metadados: {e}")
+    return _metadados_memoria
+
+def obter_metadados_cache(chave):
+    """Retorna o info salvo para a chave, ou None se não existir ou tiver expirado"""
+    with _metadados_lock:
+        metadados = _carregar_metadados()
+        registro = metadados.get(chave)
+        if not registro:
+            return None
+        if time.time() - registro.get('salvo_em', 0) > METADADOS_TTL:
+            del metadados[chave]
+            return None
+        metadados.move_to_end(chave)
+        return registro['info']
+
+def resumir_info(info):
+    """Só os campos do info usados pelo app (ver METADADOS_CAMPOS)"""
+    resumo = {campo: info[campo] for campo in METADADOS_CAMPOS if campo in info}
+    if isinstance(info.get('entries'), list):
+        resumo['entries'] = [{campo: entry.get(campo) for campo in METADADOS_CAMPOS_ITEM}
+                             for entry in info['entries'] if entry]
+    return resumo
+
+def salvar_metadados_cache(chave, info):
+    """Guarda um info (resumido) no cache de metadados, descartando os menos usados além do limite"""
+    with _metadados_lock:
+        metadados = _carregar_metadados()
+        metadados[chave] = {'salvo_em': time.time(), 'info': resumir_info(info)}
+        metadados.move_to_end(chave)
+        while len(metadados) > METADADOS_MAX_ENTRADAS:
+            metadados.popitem(last=False)
+        try:
+            _escrever_json_atomico(_caminho_metadados(), metadados)
+        except Exception as e:
+            print(f"Erro ao salvar metadados: {e}")
+
+class _EtapaInativa:
+    """Etapa usada quando não há rastreamento ativo: não mede nem guarda nada"""
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, tipo, erro, tb):
+        return False
+    
+    def marcar(self, **args):
+        pass
+
+_ETAPA_INATIVA = _EtapaInativa()
+
+class _Etapa:
+    __slots__ = ('rastreamento', 'nome', 'args', 'inicio')
+    
+    def __init__(self, rastreamento, nome, args):
+        self.rastreamento = rastreamento
+        self.nome = nome
+        self.args = args
+    
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+    
+    def __exit__(self, tipo, erro, tb):
+        if tipo is not None:
+            self.args['erro'] = tipo.__name__
+        self.rastreamento.registrar(self.nome, self.inicio, time.perf_counter(), self.args)
+        return False
+    
+    def marcar(self, **args):
+        """Acrescenta dados conhecidos só durante a etapa (bytes, método...)"""
+        self.args.update(args)
+
+def rastrear(nome, **args):
+    """Mede uma etapa no rastreamento ativo nesta thread (ver Rastreamento.ativar)
+    
+    Sem rastreamento ativo, retorna uma etapa inativa compartilhada: o custo é
+    uma leitura de atributo (com valor padrão na classe, sem AttributeError).
+    """
+    atual = _rastreamento_local.atual
+    if atual is None:
+        return _ETAPA_INATIVA
+    rastreamento, contexto = atual
+    return _Etapa(rastreamento, nome, {**contexto, **args} if contexto else args)
+
+def propagar_rastreamento(funcao):
+    """Faz funcao, executada em outra thread, herdar o rastreamento desta"""
+    atual = _rastreamento_local.atual
+    if atual is None:
+        return funcao
+    
+    def _executar(*args, **kwargs):
+        anterior = _rastreamento_local.atual
+        _rastreamento_local.atual = atual
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            _rastreamento_local.atual = anterior
+    return _executar
+
+class Rastreamento:
+    """Etapas cronometradas de um job, exportáveis como eventos do Chrome
+    
+    As etapas são medidas com rastrear() nas threads em que o rastreamento foi
+    ativado com ativar(); o contexto passado (ex.: video=...) vai para todas
+    elas. Cada etapa guarda a thread (worker) e os dados marcados, como bytes.
+    exportar() grava o JSON de eventos (chrome://tracing, Perfetto) e resumo()
+    aponta as etapas e os itens mais lentos.
+    """
+    
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self._lock = threading.Lock()
+        self._eventos = []
+        self._threads = {}
+    
+    @contextmanager
+    def ativar(self, **contexto):
+        anterior = _rastreamento_local.atual
+        _rastreamento_local.atual = (self, contexto)
+        try:
+            yield self
+        finally:
+            _rastreamento_local.atual = anterior
+    
+    def registrar(self, nome, inicio, fim, args):
+        thread = threading.current_thread()
+        with self._lock:
+            self._eventos.append((nome, thread.ident, inicio, fim, args))
+            self._threads[thread.ident] = thread.name
+    
+    def eventos_chrome(self):
+        """Eventos no formato Trace Event (fase 'X', tempos em microssegundos)"""
+        with self._lock:
+            eventos, threads = list(self._eventos), dict(self._threads)
+        saida = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': nome}}
+                 for tid, nome in threads.items()]
+        for nome, tid, inicio, fim, args in eventos:
+            saida.append({
+                'name': nome, 'cat': 'etapa', 'ph': 'X', 'pid': os.getpid(), 'tid': tid,
+                'ts': round((inicio - self.inicio) * 1e6, 1), 'dur': round((fim - inicio) * 1e6, 1),
+                'args': args,
+            })
+        return saida
+    
+    def exportar(self, caminho):
+        _escrever_json_atomico(caminho, {'traceEvents': self.eventos_chrome(), 'displayTimeUnit': 'ms'})
+    
+    def resumo(self, quantidade=RASTREAMENTO_MAIS_LENTOS):
+        """Tempo total por etapa, os itens (vídeos) e as etapas mais lentas"""
+        with self._lock:
+            eventos, threads = list(self._eventos), dict(self._threads)
+        
+        etapas = {}
+        itens = {}
+        for nome, tid, inicio, fim, args in eventos:
+            duracao = fim - inicio
+            etapa = etapas.setdefault(nome, {'quantidade': 0, 'total_s': 0.0, 'maximo_s': 0.0, 'bytes': 0})
+            etapa['quantidade'] += 1
+            etapa['total_s'] += duracao
+            etapa['maximo_s'] = max(etapa['maximo_s'], duracao)
+            etapa['bytes'] += args.get('bytes') or 0
+            if args.get('video'):
+                item = itens.setdefault(args['video'], {'video': args['video'], 'total_s': 0.0, 'etapas': {}})
+                item['total_s'] += duracao
+                item['etapas'][nome] = item['etapas'].get(nome, 0.0) + duracao
+        
+        mais_lentas = sorted(eventos, key=lambda e: e[3] - e[2], reverse=True)[:quantidade]
+        return {
+            'etapas': {nome: {**e, 'total_s': round(e['total_s'], 3), 'maximo_s': round(e['maximo_s'], 3)}
+                       for nome, e in sorted(etapas.items(), key=lambda par: -par[1]['total_s'])},
+            'itens_mais_lentos': [
+                {**item, 'total_s': round(item['total_s'], 3),
+                 'etapas': {nome: round(seg, 3) for nome, seg in item['etapas'].items()}}
+                for item in sorted(itens.values(), key=lambda i: i['total_s'], reverse=True)[:quantidade]
+            ],
+            'etapas_mais_lentas': [
+                {'etapa': nome, 'duracao_s': round(fim - inicio, 3), 'worker': threads.get(tid), **args}
+                for nome, tid, inicio, fim, args in mais_lentas
+            ],
+        }
+    
+    def texto_resumo(self, quantidade=RASTREAMENTO_MAIS_LENTOS):
+        """Linhas curtas para o log do job"""
+        r = self.resumo(quantidade)
+        linhas = ['Etapas: ' + ' | '.join(f"{nome}: {e['total_s']:.1f}s ({e['quantidade']}x)"
+                                          for nome, e in r['etapas'].items())]
+        if r['itens_mais_lentos']:
+            linhas.append('Itens mais lentos: ' + ', '.join(f"{i['video']} {i['total_s']:.1f}s"
+                                                            for i in r['itens_mais_lentos']))
+        if r['etapas_mais_lentas']:
+            linhas.append('Etapas mais lentas: ' + ', '.join(
+                f"{e['etapa']}{' ' + e['video'] if e.get('video') else ''} {e['duracao_s']:.1f}s"
+                for e in r['etapas_mais_lentas']))
+        return '\n'.join(linhas)
+
+def caminho_rastreamento(tipo):
+    """Arquivo para o rastreamento de um job; mantém só os RASTREAMENTOS_MAXIMO mais recentes"""
+    pasta = os.path.join(criar_estrutura_pastas(), 'cache', RASTREAMENTOS_PASTA)
+    os.makedirs(pasta, exist_ok=True)
+    antigos = sorted(os.listdir(pasta))
+    for nome in antigos[:max(0, len(antigos) - RASTREAMENTOS_MAXIMO + 1)]:
+        try:
+            os.remove(os.path.join(pasta, nome))
+        except OSError:
+            pass
+    return os.path.join(pasta, f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}_{tipo or 'erro'}.json")
+
+class Metricas:
+    """Throughput, ETA, tempo por etapa e acertos do cache de um job
+    
+    hook_progresso é registrado como progress_hook do yt-dlp e recebe os bytes
+    de cada download em andamento. Os valores podem ser lidos a qualquer momento
+    com resumo() e são gravados periodicamente no arquivo (ver caminho_estatisticas).
+    """
+    
+    def __init__(self, arquivo=None, janela=5.0):
+        self.arquivo = arquivo
+        self.janela = janela
+        self.inicio = time.monotonic()
+        self.num_workers = None
+        self.controle = None
+        self._lock = threading.Lock()
+        self._amostras = deque()
+        self._ativos = {}
+        self._ultima_gravacao = 0.0
+        self.bytes_baixados = 0
+        self.downloads_concluidos = 0
+        self.tempos = {}
+        self.acertos_cache = 0
+        self.faltas_cache = 0
+        self.itens_concluidos = 0
+        self.itens_total = None
+        self.download_paralelo = None
+        self.rastreamento = None
+    
+    def hook_progresso(self, d):
+        """progress_hook do yt-dlp: contabiliza os bytes recebidos desde a última chamada"""
+        chave = d.get('tmpfilename') or d.get('filename')
+        baixado = d.get('downloaded_bytes') or 0
+        agora = time.monotonic()
+        
+        with self._lock:
+            anterior, _ = self._ativos.get(chave, (0, None))
+            delta = baixado - anterior if baixado >= anterior else baixado
+            self.bytes_baixados += delta
+            self._amostras.append((agora, self.bytes_baixados))
+            while self._amostras and agora - self._amostras[0][0] > self.janela:
+                self._amostras.popleft()
+            
+            if d.get('status') == 'downloading':
+                self._ativos[chave] = (baixado, d.get('total_bytes') or d.get('total_bytes_estimate'))
+            else:
+                self._ativos.pop(chave, None)
+                if d.get('status') == 'finished':
+                    self.downloads_concluidos += 1
+        
+        self.salvar()
+    
+    def registrar_etapa(self, nome, segundos):
+        with self._lock:
+            self.tempos[nome] = self.tempos.get(nome, 0.0) + segundos
+    
+    def registrar_cache(self, acerto):
+        with self._lock:
+            if acerto:
+                self.acertos_cache += 1
+            else:
+                self.faltas_cache += 1
+    
+    def registrar_download_paralelo(self, relatorio):
+        """Guarda o relatório do último download em várias conexões (ver baixar_por_intervalos)"""
+        with self._lock:
+            self.download_paralelo = relatorio
+    
+    def registrar_itens(self, concluidos, total=None):
+        with self._lock:
+            self.itens_concluidos = concluidos
+            if total is not None:
+                self.itens_total = total
+    
+    def _velocidade(self):
+        if len(self._amostras) < 2:
+            return 0.0
+        (t0, b0), (t1, b1) = self._amostras[0], self._amostras[-1]
+        return (b1 - b0) / (t1 - t0) if t1 > t0 else 0.0
+    
+    def resumo(self):
+        """Retorna um dict (serializável em JSON) com o estado atual das métricas"""
+        with self._lock:
+            velocidade = self._velocidade()
+            duracao = time.monotonic() - self.inicio
+            
+            restante = [total - baixado for baixado, total in self._ativos.values() if total]
+            eta_downloads = sum(restante) / velocidade if velocidade > 0 and restante else None
+            
+            eta_job = None
+            if self.itens_total and self.itens_concluidos:
+                por_item = duracao / self.itens_concluidos
+                eta_job = por_item * max(self.itens_total - self.itens_concluidos, 0)
+            
+            consultas = self.acertos_cache + self.faltas_cache
+            progresso_atual = None
+            if len(self._ativos) == 1:
+                baixado, total = next(iter(self._ativos.values()))
+                if total:
+                    progresso_atual = baixado / total
+            
+            return {
+                'duracao_s': round(duracao, 2),
+                'num_workers': self.num_workers,
+                'velocidade_bps': round(velocidade, 1),
+                'velocidade_media_bps': round(self.bytes_baixados / duracao, 1) if duracao > 0 else 0.0,
+                'bytes_baixados': self.bytes_baixados,
+                'downloads_ativos': len(self._ativos),
+                'downloads_concluidos': self.downloads_concluidos,
+                'progresso_download_atual': progresso_atual,
+                'eta_downloads_s': round(eta_downloads, 1) if eta_downloads is not None else None,
+                'eta_job_s': round(eta_job, 1) if eta_job is not None else None,
+                'itens': {'concluidos': self.itens_concluidos, 'total': self.itens_total},
+                'tempos_etapas_s': {nome: round(seg, 3) for nome, seg in self.tempos.items()},
+                'cache': {
+                    'acertos': self.acertos_cache,
+                    'faltas': self.faltas_cache,
+                    'taxa_acerto': round(self.acertos_cache / consultas, 3) if consultas else None,
+                },
+                'rede': self.controle.resumo() if self.controle else None,
+                'download_paralelo': self.download_paralelo,
+                'atualizado_em': time.time(),
+            }
+    
+    def texto_resumo(self):
+        """Linha curta para a interface"""
+        r = self.resumo()
+        partes = [f"{formatar_bytes(r['velocidade_bps'])}/s"]
+        eta = r['eta_job_s'] if r['eta_job_s'] is not None else r['eta_downloads_s']
+        if eta is not None:
+            partes.append(f"ETA {int(eta) // 60}:{int(eta) % 60:02d}")
+        if r['cache']['taxa_acerto'] is not None:
+            partes.append(f"cache {r['cache']['taxa_acerto'] * 100:.0f}%")
+        if r['rede'] and r['rede']['limite'] < r['rede']['teto']:
+            partes.append(f"{r['rede']['limite']}/{r['rede']['teto']} downloads (limitado)")
+        return ' | '.join(partes)
+    
+    def salvar(self, forcar=False):
+        """Grava o resumo no arquivo JSON (no máximo a cada ESTATISTICAS_INTERVALO_GRAVACAO)"""
+        if not self.arquivo:
+            return
+        agora = time.monotonic()
+        with self._lock:
+            if not forcar and agora - self._ultima_gravacao < ESTATISTICAS_INTERVALO_GRAVACAO:
+                return
+            self._ultima_gravacao = agora
+        try:
+            _escrever_json_atomico(self.arquivo, self.resumo())
+        except Exception as e:
+            print(f"Erro ao salvar estatísticas: {e}")
+
+def caminho_estatisticas(trabalho_id=None):
+    """cache/estatisticas.json, ou cache/estatisticas/<id>.json para um trabalho do Escalonador"""
+    if trabalho_id is None:
+        return os.path.join(criar_estrutura_pastas(), 'cache', ESTATISTICAS_ARQUIVO)
+    pasta = os.path.join(criar_estrutura_pastas(), 'cache', ESTATISTICAS_PASTA)
+    os.makedirs(pasta, exist_ok=True)
+    return os.path.join(pasta, f'{trabalho_id}.json')
+
+def remover_estatisticas(trabalho_id):
+    try:
+        os.remove(os.path.join(criar_estrutura_pastas(), 'cache', ESTATISTICAS_PASTA, f'{trabalho_id}.json'))
+    except OSError:
+        pass
+
+class SessaoDownload:
+    """Instâncias do yt-dlp reaproveitadas durante um job
+    
+    Criar um YoutubeDL inicializa extratores, cookies e conexões; aqui cada
+    thread cria uma instância por perfil de opções na primeira vez e a reusa
+    nos itens seguintes, mantendo as conexões HTTP abertas (keep-alive).
+    As opções de cada perfil não mudam entre itens: o nome do arquivo usa
+    %(id)s e o destino final é decidido por quem chamou. Com metricas, todas
+    as instâncias reportam o progresso dos downloads a ela.
+    """
+    
+    def __init__(self, metricas=None):
+        self.metricas = metricas
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._instancias = []
+        self.criadas = 0
+        self.reutilizadas = 0
+    
+    def ydl(self, perfil, opcoes):
+        """Retorna o YoutubeDL desta thread para o perfil, criando-o na primeira chamada"""
+        import yt_dlp
+        
+        instancias = getattr(self._local, 'instancias', None)
+        if instancias is None:
+            instancias = self._local.instancias = {}
+        
+        ydl = instancias.get(perfil)
+        if ydl is None:
+            if self.metricas is not None:
+                opcoes = dict(opcoes, progress_hooks=[self.metricas.hook_progresso])
+            ydl = yt_dlp.YoutubeDL(opcoes)
+            ydl.__enter__()
+            instancias[perfil] = ydl
+            with self._lock:
+                self._instancias.append(ydl)
+                self.criadas += 1
+        else:
+            with self._lock:
+                self.reutilizadas += 1
+        return ydl
+    
+    def fechar(self):
+        with self._lock:
+            instancias, self._instancias = self._instancias, []
+        for ydl in instancias:
+            try:
+                ydl.__exit__(None, None, None)
+            except Exception as e:
+                print(f"Erro ao encerrar sessão do yt-dlp: {e}")
+
+def _chave_metadados(url, extract_flat=True):
+    return f"{normalizar_url(url)}|{'flat' if extract_flat else 'completo'}"
+
+def extrair_info(url, extract_flat=True, lazy=False, sessao=None, atualizar=False):
+    """Executa extract_info do yt-dlp reaproveitando o cache de metadados
+    
+    Com atualizar=True o cache não é consultado (o resultado novo o substitui).
+    Com lazy=True, playlists que não estão no cache são retornadas sem
+    paginar: 'entries' é um iterável consumido por iterar_playlist, que
+    salva o resultado no cache ao terminar (a sessão precisa continuar
+    aberta até lá). Sem sessao, a listagem é feita por inteiro, porque a
+    sessão criada aqui é fechada antes de retornar.
+    Pode levantar ImportError (yt-dlp ausente) ou os erros do próprio yt-dlp.
+    """
+    chave = _chave_metadados(url, extract_flat)
+    info = None if atualizar else obter_metadados_cache(chave)
+    if info is not None:
+        return info
+    
+    sessao_propria = sessao is None
+    if sessao_propria:
+        sessao = SessaoDownload()
+        lazy = False
+    
+    try:
+        ydl_opts = {'quiet': True, 'no_warnings': True, 'extract_flat': extract_flat}
+        ydl = sessao.ydl('flat' if extract_flat else 'completo', ydl_opts)
+        
+        with rastrear('extract_info', url=url):
+            info = ydl.extract_info(url, download=False, process=not lazy)
+            if lazy and info and info.get('_type') in ('url', 'url_transparent'):
+                # Redirecionamento (ex.: canal -> aba de vídeos): precisa ser resolvido
+                info = ydl.extract_info(info['url'], download=False, process=False)
+        if lazy and info and info.get('_type') in ('playlist', 'multi_video'):
+            return info
+        if info:
+            info = ydl.sanitize_info(info)
+            salvar_metadados_cache(chave, info)
+        return info
+    finally:
+        if sessao_propria:
+            sessao.fechar()
+
+def detectar_tipo_url(url, sessao=None, atualizar=False):
+    """Detecta se a URL é de uma playlist, vídeo individual ou clip
+    
+    Para playlists a listagem não é paginada aqui: o info retornado deve ser
+    passado para iterar_playlist, que baixa as páginas sob demanda.
+    Com atualizar=True a listagem vem do YouTube, ignorando o cache de metadados.
+    """
+    try:
+        import yt_dlp
+    except ImportError:
+        return None, "yt-dlp não está instalado"
+    
+    if '/clip/' in url:
+        try:
+            info = extrair_info(url, extract_flat=False, sessao=sessao, atualizar=atualizar)
+            if info:
+                return 'clip', info
+        except Exception as e:
+            return None, f"Erro ao acessar clip: {str(e)[:100]}"
+    
+    try:
+        info = extrair_info(url, lazy=True, sessao=sessao, atualizar=atualizar)
+        
+        if 'entries' in info and info.get('_type') == 'playlist':
+            playlist_id = info.get('id', '')
+            if playlist_id.startswith('RD') or playlist_id.startswith('UL'):
+                primeiro = next(iter(info.get('entries') or []), None)
+                return 'video', primeiro or info
+            return 'playlist', info
+        else:
+            return 'video', info
+                
+    except Exception as e:
+        error_msg = str(e)
+        if 'unavailable' in error_msg.lower():
+            return None, "Vídeo indisponível"
+        elif 'private' in error_msg.lower():
+            return None, "Vídeo privado"
+        else:
+            return None, f"Erro: {error_msg[:100]}"
+
+def iterar_playlist(playlist_url, info=None, ao_descobrir_total=None, sessao=None):
+    """Gera os vídeos da playlist à medida que as páginas chegam do YouTube
+    
+    Cada item é um dict com 'id' e 'title'. ao_descobrir_total(total) é chamado
+    assim que o tamanho da playlist é conhecido (pode ser só no final).
+    Sem info nem sessao, a sessão usada na listagem é criada aqui e fechada
+    quando a iteração termina.
+    """
+    sessao_propria = info is None and sessao is None
+    if sessao_propria:
+        sessao = SessaoDownload()
+    try:
+        if info is None:
+            info = extrair_info(playlist_url, lazy=True, sessao=sessao)
+        if info:
+            yield from _iterar_entries(playlist_url, info, ao_descobrir_total)
+    finally:
+        if sessao_propria:
+            sessao.fechar()
+
+def _iterar_entries(playlist_url, info, ao_descobrir_total):
+    entries = info.get('entries') or []
+    total = info.get('playlist_count')
+    if total is None and isinstance(entries, list):
+        total = len(entries)
+    if total is not None and ao_descobrir_total:
+        ao_descobrir_total(total)
+    
+    # Entradas já materializadas vieram do cache; as demais são guardadas para ele
+    coletadas = None if isinstance(entries, list) else []
+    quantidade = 0
+    
+    for entry in entries:
+        if not entry:
+            continue
+        video = {'id': entry.get('id', ''), 'title': entry.get('title') or 'Sem título'}
+        quantidade += 1
+        if coletadas is not None:
+            if len(coletadas) < METADADOS_MAX_ITENS_PLAYLIST:
+                coletadas.append(video)
+            else:
+                coletadas = None
+        yield video
+    
+    if total is None and ao_descobrir_total:
+        ao_descobrir_total(quantidade)
+    
+    if coletadas is not None:
+        salvar_metadados_cache(_chave_metadados(playlist_url), {
+            '_type': 'playlist',
+            'id': info.get('id', ''),
+            'title': info.get('title', ''),
+            'entries': coletadas,
+        })
+
+def obter_info_playlist(playlist_url):
+    """Obtém informações sobre os vídeos da playlist (lista completa)"""
+    try:
+        return list(iterar_playlist(playlist_url))
+    except Exception as e:
+        print(f"Erro ao obter playlist: {e}")
+        return []
+
+def formatar_bytes(num_bytes):
+    """Formata uma quantidade de bytes para exibição"""
+    valor = float(num_bytes)
+    for unidade in ('B', 'KB', 'MB'):
+        if valor < 1024:
+            return f"{valor:.1f} {unidade}"
+        valor /= 1024
+    return f"{valor:.1f} GB"
+
+def _reflink(origem, destino):
+    """Clona o arquivo com copy-on-write (ioctl FICLONE do Linux: Btrfs, XFS, etc.)"""
+    import fcntl
+    FICLONE = 0x40049409
+    with open(origem, 'rb') as f_origem, open(destino, 'wb') as f_destino:
+        fcntl.ioctl(f_destino.fileno(), FICLONE, f_origem.fileno())
+
+def _criar_com_metodo(metodo, origem, destino):
+    """Cria destino a partir de origem usando um dos METODOS_MATERIALIZACAO"""
+    if metodo == 'reflink':
+        _reflink(origem, destino)
+    elif metodo == 'hardlink':
+        os.link(origem, destino)
+    elif metodo == 'symlink':
+        os.symlink(os.path.abspath(origem), destino)
+    else:
+        shutil.copy2(origem, destino)
+
+def materializar_arquivo(origem, destino, modo=MATERIALIZACAO_AUTO):
+    """Coloca o arquivo do cache no destino sem duplicar os dados, quando possível
+    
+    Usa o primeiro método suportado pelo sistema de arquivos e só copia quando
+    nenhum outro funciona. O destino é substituído de forma atômica.
+    Retorna o método usado.
+    """
+    if os.path.exists(destino) and os.path.samefile(origem, destino):
+        return 'symlink' if os.path.islink(destino) else 'hardlink'
+    
+    if modo == MATERIALIZACAO_COPIA:
+        candidatos = [MATERIALIZACAO_COPIA]
+    else:
+        chave = (os.stat(origem).st_dev, os.stat(os.path.dirname(destino) or '.').st_dev)
+        with _metodos_lock:
+            indisponiveis = set(_metodos_indisponiveis.get(chave, ()))
+        candidatos = [m for m in METODOS_MATERIALIZACAO if m not in indisponiveis or m == MATERIALIZACAO_COPIA]
+    
+    temporario = f"{destino}.{threading.get_ident()}.tmp"
+    for metodo in candidatos:
+        try:
+            _criar_com_metodo(metodo, origem, temporario)
+            os.replace(temporario, destino)
+            return metodo
+        except (OSError, ImportError):
+            if os.path.lexists(temporario):
+                os.remove(temporario)
+            if metodo == MATERIALIZACAO_COPIA:
+                raise
+            with _metodos_lock:
+                _metodos_indisponiveis.setdefault(chave, set()).add(metodo)
+
+def nome_arquivo_playlist(video_title, arquivo_cache):
+    """Nome do arquivo de uma música dentro da pasta da playlist"""
+    _, ext = os.path.splitext(arquivo_cache)
+    return f"{sanitizar_nome_arquivo(video_title)}{ext}"
+
+def copiar_do_cache(video_hash, video_title, output_path, cache, modo=MATERIALIZACAO_AUTO):
+    """Coloca uma música do cache na pasta da playlist
+    
+    Retorna o método usado (ver materializar_arquivo) ou False em caso de erro.
+    """
+    try:
+        cache_info = cache.get(video_hash)
+        if not cache_info:
+            return False
+        
+        arquivo_cache = cache_info.get('arquivo_cache')
+        if not arquivo_valido(cache_info):
+            return False
+        
+        arquivo_destino = os.path.join(output_path, nome_arquivo_playlist(video_title, arquivo_cache))
+        
+        with rastrear('copiar_do_cache', bytes=cache_info.get('tamanho')) as etapa:
+            metodo = materializar_arquivo(arquivo_cache, arquivo_destino, modo)
+            registrar_acesso_cache(cache, video_hash)
+            etapa.marcar(metodo=metodo)
+        return metodo
+        
+    except Exception as e:
+        print(f"Erro ao copiar do cache: {e}")
+        return False
+
+def _caminho_fila_retentativas():
+    return os.path.join(criar_estrutura_pastas(), 'cache', FILA_RETENTATIVAS_ARQUIVO)
+
+def carregar_fila_retentativas():
+    """Carrega a fila de retentativas: {video_hash: {video_id, tentativas, proxima_tentativa, ...}}"""
+    try:
+        caminho = _caminho_fila_retentativas()
+        if os.path.exists(caminho):
+            with open(caminho, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    except Exception as e:
+        print(f"Erro ao carregar fila de retentativas: {e}")
+    return {}
+
+def _salvar_fila_retentativas(fila):
+    try:
+        _escrever_json_atomico(_caminho_fila_retentativas(), fila)
+    except Exception as e:
+        print(f"Erro ao salvar fila de retentativas: {e}")
+
+def calcular_espera_retentativa(tentativas, base=RETENTATIVA_ESPERA_BASE, maximo=RETENTATIVA_ESPERA_MAXIMA):
+    """Espera exponencial com jitter: metade fixa e metade aleatória do intervalo"""
+    espera = min(maximo, base * (2 ** tentativas))
+    return espera / 2 + random.uniform(0, espera / 2)
+
+def erro_permanente(erro_str):
+    """Indica se o erro não vai se resolver tentando de novo (vídeo removido, privado...)"""
+    erro_str = erro_str.lower()
+    return any(trecho in erro_str for trecho in ERROS_PERMANENTES)
+
+def agendar_retentativa(video_hash, dados, erro):
+    """Coloca (ou mantém) um download na fila persistente com a próxima tentativa agendada"""
+    with _fila_lock:
+        fila = carregar_fila_retentativas()
+        registro = fila.get(video_hash, dados)
+        registro.update(dados)
+        tentativas = registro.get('tentativas', 0)
+        if tentativas >= RETENTATIVAS_MAXIMAS:
+            fila.pop(video_hash, None)
+        else:
+            registro['tentativas'] = tentativas + 1
+            registro['proxima_tentativa'] = time.time() + calcular_espera_retentativa(tentativas)
+            registro['erro'] = erro[:200]
+            fila[video_hash] = registro
+        _salvar_fila_retentativas(fila)
+
+def concluir_retentativa(video_hash):
+    """Tira o download da fila de retentativas (após sucesso)"""
+    with _fila_lock:
+        fila = carregar_fila_retentativas()
+        if fila.pop(video_hash, None) is not None:
+            _salvar_fila_retentativas(fila)
+
+def retentativa_agendada(video_hash):
+    with _fila_lock:
+        return video_hash in carregar_fila_retentativas()
+
+def processar_fila_retentativas(cache, ffmpeg_disponivel, log=print, pool=None):
+    """Executa as retentativas cujo horário já chegou
+    
+    Itens que vieram de uma playlist são colocados de volta na pasta dela.
+    Cada download passa por baixar_uma_vez, para não disputar o arquivo com um
+    job que esteja baixando o mesmo vídeo; com um PoolDownloads, ele ocupa as
+    vagas de rede e o controle de ritmo do pool, como os jobs.
+    Retorna o intervalo em segundos até a próxima retentativa (ou None se a fila esvaziou).
+    """
+    with _fila_lock:
+        fila = carregar_fila_retentativas()
+    
+    agora = time.time()
+    pipeline = pool.pipeline() if pool is not None else None
+    try:
+        for video_hash, registro in fila.items():
+            if registro.get('proxima_tentativa', 0) > agora:
+                continue
+            formato_video = registro.get('formato_video', 'mp3')
+            
+            def _baixar():
+                # Outro job pode ter terminado este vídeo enquanto a retentativa esperava
+                if entrada_atende(cache.get(video_hash), formato_video, ffmpeg_disponivel):
+                    concluir_retentativa(video_hash)
+                    return True, None
+                return download_para_cache(
+                    registro['video_id'], registro.get('title', 'Sem título'), video_hash, cache, ffmpeg_disponivel,
+                    registro.get('is_individual', False), formato_video, pipeline=pipeline,
+                    destino=registro.get('destino'))
+            
+            sucesso, erro = baixar_uma_vez(video_hash, _baixar)
+            
+            destino = registro.get('destino')
+            if sucesso and destino:
+                titulo = registro.get('title', 'Sem título')
+                output_path = destino['output_path']
+                if copiar_do_cache(video_hash, titulo, output_path, cache, destino.get('modo', MATERIALIZACAO_AUTO)):
+                    # Anota no manifesto da playlist, para a sincronização reconhecer o arquivo
+                    item = ItemPlaylist(0, registro['video_id'], titulo)
+                    item.video_hash = video_hash
+                    item.arquivo = nome_arquivo_playlist(titulo, cache[video_hash]['arquivo_cache'])
+                    atualizar_manifesto(output_path, lambda itens: registrar_no_manifesto(itens, item, output_path))
+            log(f"Retentativa de {registro.get('title', video_hash)[:40]}: {'ok' if sucesso else erro}")
+    finally:
+        if pipeline is not None:
+            pipeline.encerrar()
+    
+    with _fila_lock:
+        fila = carregar_fila_retentativas()
+    if not fila:
+        return None
+    return max(0, min(r.get('proxima_tentativa', 0) for r in fila.values()) - time.time())
+
+def _executar_retentativas(log):
+    while True:
+        try:
+            espera = processar_fila_retentativas(carregar_cache(), verificar_ffmpeg(), log, _retentativas_pool)
+        except Exception as e:
+            print(f"Erro ao processar retentativas: {e}")
+            espera = RETENTATIVA_ESPERA_BASE
+        if espera is None:
+            break
+        time.sleep(max(espera, 1))
+
+def iniciar_retentativas_pendentes(log=print, pool=None):
+    """Retoma em segundo plano os downloads que ficaram na fila em execuções anteriores
+    
+    O pool informado (o do Escalonador) fica guardado para as próximas chamadas.
+    """
+    global _retentativas_thread, _retentativas_pool
+    if pool is not None:
+        _retentativas_pool = pool
+    if not carregar_fila_retentativas():
+        return None
+    if _retentativas_thread is None or not _retentativas_thread.is_alive():
+        _retentativas_thread = threading.Thread(target=_executar_retentativas, args=(log,), daemon=True)
+        _retentativas_thread.start()
+    return _retentativas_thread
+
+def converter_para_mp3(origem, destino, qualidade='192'):
+    """Extrai/converte o áudio de um arquivo local para MP3 com o FFmpeg"""
+    temporario = f"{destino}.{threading.get_ident()}.tmp.mp3"
+    try:
+        with rastrear('ffmpeg', bytes=os.path.getsize(origem)):
+            resultado = subprocess.run(
+                ['ffmpeg', '-y', '-loglevel', 'error', '-i', origem,
+                 '-vn', '-codec:a', 'libmp3lame', '-b:a', f'{qualidade}k', temporario],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if resultado.returncode != 0:
+            raise RuntimeError(resultado.stderr.decode('utf-8', 'replace')[-200:])
+        os.replace(temporario, destino)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+def derivar_do_cache(video_id, video_hash, cache, formato, arquivo_cache, ffmpeg_disponivel, pipeline=None):
+    """Tenta gerar arquivo_cache a partir de outro formato do mesmo vídeo já baixado
+    
+    Se o cache já tem o vídeo no mesmo formato (em outra pasta), o arquivo é
+    reaproveitado; se tem M4A ou MP4 e o pedido é MP3, o áudio é convertido
+    localmente (nas vagas de conversão do pipeline, quando há um). Retorna o video_hash da entrada usada como origem, ou None.
+    """
+    fontes = []
+    for formato_fonte in ('mp3', 'mp4'):
+        hash_fonte = gerar_id_video(video_id, formato_fonte)
+        entrada = cache.get(hash_fonte)
+        if arquivo_valido(entrada):
+            fontes.append((hash_fonte, entrada))
+    
+    for hash_fonte, entrada in fontes:
+        if entrada.get('formato') == formato and entrada['arquivo_cache'] != arquivo_cache:
+            materializar_arquivo(entrada['arquivo_cache'], arquivo_cache)
+            return hash_fonte
+    
+    if formato == 'mp3' and ffmpeg_disponivel:
+        for hash_fonte, entrada in fontes:
+            if entrada.get('formato') in ('m4a', 'mp4'):
+                try:
+                    if pipeline:
+                        pipeline.converter(entrada['arquivo_cache'], arquivo_cache)
+                    else:
+                        converter_para_mp3(entrada['arquivo_cache'], arquivo_cache)
+                    return hash_fonte
+                except Exception as e:
+                    print(f"Erro ao converter {entrada['arquivo_cache']}: {e}")
+    
+    return None
+
+def _arquivo_baixado(ydl, info):
+    """Caminho do arquivo que o yt-dlp acabou de gravar"""
+    baixados = (info or {}).get('requested_downloads') or []
+    if baixados and baixados[0].get('filepath'):
+        return baixados[0]['filepath']
+    return ydl.prepare_filename(info)
+
+def tamanho_remoto(url, headers=None):
+    """Tamanho do arquivo se o servidor aceita requisições com Range, senão None"""
+    import urllib.request
+    
+    requisicao = urllib.request.Request(url, headers=dict(headers or {}, Range='bytes=0-0'))
+    with urllib.request.urlopen(requisicao, timeout=DOWNLOAD_TIMEOUT) as resposta:
+        intervalo = resposta.headers.get('Content-Range', '')
+        if resposta.status != 206 or '/' not in intervalo:
+            return None
+        total = intervalo.rsplit('/', 1)[1]
+        return int(total) if total.isdigit() else None
+
+def baixar_por_intervalos(url, destino, tamanho, conexoes, headers=None, limite_bps=None, ao_progredir=None):
+    """Baixa url para destino em conexoes requisições HTTP Range simultâneas
+    
+    O arquivo é pré-alocado e dividido em partes de DOWNLOAD_PARTE_TAMANHO;
+    cada conexão pega a próxima parte livre e grava os blocos direto na
+    posição dela, então conexões mais rápidas baixam mais partes e nada
+    fica acumulado em memória. limite_bps vale para a soma das conexões e
+    pode ser uma função, consultada a cada bloco, quando o limite muda
+    durante o download.
+    ao_progredir(bytes_baixados) é chamado a cada bloco.
+    
+    As partes concluídas são anotadas em destino + '.partes' (depois de
+    gravadas no disco). Se o download for interrompido, a próxima chamada
+    com o mesmo destino e tamanho baixa só as partes que faltam; a anotação
+    é apagada quando o arquivo fica completo.
+    
+    Retorna {'bytes', 'retomados', 'segundos', 'conexoes', 'velocidade_bps',
+    'velocidade_por_conexao_bps', 'aceleracao'}, onde aceleracao compara a
+    velocidade total com a média de uma conexão isolada.
+    """
+    import urllib.request
+    
+    partes = [(inicio, min(inicio + DOWNLOAD_PARTE_TAMANHO, tamanho) - 1)
+              for inicio in range(0, tamanho, DOWNLOAD_PARTE_TAMANHO)]
+    
+    anotacao = destino + '.partes'
+    concluidas = set()
+    try:
+        with open(anotacao, 'r', encoding='utf-8') as f:
+            anotado = json.load(f)
+        if (anotado.get('tamanho') == tamanho and anotado.get('parte') == DOWNLOAD_PARTE_TAMANHO
+                and os.path.getsize(destino) == tamanho):
+            concluidas = set(anotado.get('concluidas') or [])
+    except (OSError, ValueError):
+        pass
+    if not concluidas:
+        with open(destino, 'wb') as f:
+            f.truncate(tamanho)
+    
+    pendentes = [parte for parte in partes if parte[0] not in concluidas]
+    retomados = tamanho - sum(fim - inicio + 1 for inicio, fim in pendentes)
+    conexoes = max(1, min(conexoes, len(pendentes)))
+    
+    lock = threading.Lock()
+    proxima = 0
+    baixados = retomados
+    velocidades = []
+    
+    def _proxima_parte():
+        nonlocal proxima
+        with lock:
+            if proxima >= len(pendentes):
+                return None
+            proxima += 1
+            return pendentes[proxima - 1]
+    
+    def _concluir_parte(f, inicio):
+        f.flush()
+        os.fsync(f.fileno())
+        with lock:
+            concluidas.add(inicio)
+            _escrever_json_atomico(anotacao, {'tamanho': tamanho, 'parte': DOWNLOAD_PARTE_TAMANHO,
+                                              'concluidas': sorted(concluidas)})
+    
+    def _conexao():
+        nonlocal baixados
+        recebidos = 0
+        ativo = 0.0
+        with open(destino, 'r+b') as f:
+            while True:
+                parte = _proxima_parte()
+                if parte is None:
+                    break
+                inicio, fim = parte
+                requisicao = urllib.request.Request(url, headers=dict(headers or {}, Range=f'bytes={inicio}-{fim}'))
+                comeco = time.monotonic()
+                with urllib.request.urlopen(requisicao, timeout=DOWNLOAD_TIMEOUT) as resposta:
+                    if resposta.status != 206:
+                        raise IOError(f'Servidor ignorou o Range (HTTP {resposta.status})')
+                    f.seek(inicio)
+                    restante = fim - inicio + 1
+                    while restante > 0:
+                        bloco = resposta.read(min(DOWNLOAD_BLOCO, restante))
+                        if not bloco:
+                            raise IOError(f'Parte {inicio}-{fim} terminou antes do esperado')
+                        f.write(bloco)
+                        restante -= len(bloco)
+                        recebidos += len(bloco)
+                        with lock:
+                            baixados += len(bloco)
+                            total = baixados
+                        if ao_progredir:
+                            ao_progredir(total)
+                        limite = limite_bps() if callable(limite_bps) else limite_bps
+                        if limite:
+                            atraso = (total - retomados) / limite - (time.monotonic() - inicio_download)
+                            if atraso > 0:
+                                time.sleep(atraso)
+                ativo += time.monotonic() - comeco
+                _concluir_parte(f, inicio)
+        if recebidos and ativo > 0:
+            with lock:
+                velocidades.append(recebidos / ativo)
+    
+    inicio_download = time.monotonic()
+    with ThreadPoolExecutor(max_workers=conexoes) as executor:
+        for futuro in [executor.submit(_conexao) for _ in range(conexoes)]:
+            futuro.result()
+    segundos = time.monotonic() - inicio_download
+    
+    if os.path.getsize(destino) != tamanho or baixados != tamanho:
+        raise IOError(f'Download incompleto: {baixados} de {tamanho} bytes')
+    os.remove(anotacao)
+    
+    velocidade = (tamanho - retomados) / segundos if segundos > 0 else 0.0
+    por_conexao = sum(velocidades) / len(velocidades) if velocidades else 0.0
+    return {
+        'bytes': tamanho,
+        'retomados': retomados,
+        'segundos': round(segundos, 3),
+        'conexoes': conexoes,
+        'velocidade_bps': round(velocidade, 1),
+        'velocidade_por_conexao_bps': round(por_conexao, 1),
+        'aceleracao': round(velocidade / por_conexao, 2) if por_conexao else None,
+    }
+
+def _baixar_mp4_em_conexoes(ydl, video_url, pasta, conexoes, controle=None, metricas=None):
+    """Baixa um MP4 individual usando várias conexões
+    
+    Formatos em fragmentos (DASH/HLS) usam o concurrent_fragment_downloads do
+    yt-dlp; arquivos progressivos usam baixar_por_intervalos quando o servidor
+    aceita Range. Nos demais casos o download segue em uma conexão só.
+    Com um ControleAdaptativo, só a transferência ocupa uma fatia do
+    limite_banda (dividida entre as conexões) e entra na medida de velocidade.
+    Retorna (caminho do arquivo, relatório ou None).
+    """
+    with rastrear('extract_info') as etapa:
+        info = ydl.extract_info(video_url, download=False)
+        etapa.marcar(video=info.get('id'))
+    url = info.get('url')
+    protocolo = info.get('protocol') or ''
+    
+    tamanho = None
+    if url and protocolo in ('http', 'https') and not info.get('requested_formats'):
+        try:
+            tamanho = tamanho_remoto(url, info.get('http_headers'))
+        except Exception as e:
+            print(f"Erro ao consultar tamanho do vídeo: {e}")
+    
+    # Sufixo próprio: o '.part' é o arquivo que o yt-dlp retoma com continuedl, e um
+    # arquivo pré-alocado pela metade seria tomado por um download completo
+    arquivo = os.path.join(pasta, f"{info['id']}.{info.get('ext') or 'mp4'}")
+    parcial = arquivo + '.intervalos'
+    
+    if not tamanho:
+        for resto in (parcial, parcial + '.partes'):
+            if os.path.exists(resto):
+                os.remove(resto)
+        ydl.params['concurrent_fragment_downloads'] = conexoes
+        
+        def _transferir(banda):
+            with rastrear('download', video=info.get('id'), conexoes=conexoes):
+                return _arquivo_baixado(ydl, ydl.process_ie_result(info, download=True))
+        
+        return (controle.transferir(ydl, _transferir) if controle else _transferir(None)), None
+    
+    os.makedirs(pasta, exist_ok=True)
+    
+    def _progresso(baixado):
+        if metricas is not None:
+            metricas.hook_progresso({'status': 'downloading', 'downloaded_bytes': baixado,
+                                     'total_bytes': tamanho, 'tmpfilename': parcial})
+    
+    relatorio = None
+    
+    def _transferir(banda):
+        nonlocal relatorio
+        limite_bps = (lambda: banda.limite) if banda is not None else None
+        with rastrear('download', video=info.get('id'), conexoes=conexoes, bytes=tamanho):
+            relatorio = baixar_por_intervalos(url, parcial, tamanho, conexoes, info.get('http_headers'),
+                                              limite_bps, _progresso)
+        return parcial
+    
+    if controle:
+        controle.transferir(ydl, _transferir)
+    else:
+        _transferir(None)
+    if metricas is not None:
+        metricas.hook_progresso({'status': 'finished', 'downloaded_bytes': tamanho,
+                                 'total_bytes': tamanho, 'tmpfilename': parcial})
+        metricas.registrar_download_paralelo(relatorio)
+    os.replace(parcial, arquivo)
+    return arquivo, relatorio
+
+def download_para_cache(video_id, video_title, video_hash, cache, ffmpeg_disponivel, is_individual=False, formato_video='mp3',
+                        ao_converter=None, pipeline=None, destino=None, sessao=None, conexoes=1):
+    """Baixa uma música/vídeo diretamente para o cache
+
+    ao_converter é chamado (sem argumentos) quando o FFmpeg começa a converter o arquivo.
+    Com um PipelineDownload, o download ocupa uma das vagas de rede do pipeline e a
+    conversão para MP3 roda no pool de FFmpeg dele, liberando a vaga para outro download.
+    
+    O download é feito em cache/staging (arquivos .part são retomados de onde
+    pararam) e só depois movido para o cache. Erros temporários colocam o vídeo
+    na fila de retentativas; destino ({'output_path', 'modo'}) indica a pasta
+    de playlist onde a retentativa deve colocar o arquivo.
+    
+    sessao (ou a do pipeline) reaproveita o YoutubeDL entre itens; sem ela,
+    uma sessão é criada e fechada só para este download.
+    
+    Com conexoes > 1, um MP4 individual é baixado em várias conexões
+    (ver _baixar_mp4_em_conexoes).
+    """
+    try:
+        import yt_dlp
+    except ImportError:
+        return False, "yt-dlp não está disponível"
+    
+    if sessao is None and pipeline is not None:
+        sessao = pipeline.sessao
+    sessao_propria = sessao is None
+    if sessao_propria:
+        sessao = SessaoDownload()
+    
+    try:
+        base_path = criar_estrutura_pastas()
+        
+        if is_individual:
+            if formato_video == 'mp4':
+                cache_path = os.path.join(base_path, 'cache', 'videos_individuais_mp4')
+                tipo = 'individual_mp4'
+                formato = 'mp4'
+            else:
+                cache_path = os.path.join(base_path, 'cache', 'videos_individuais_mp3')
+                tipo = 'individual_mp3'
+                formato = 'mp3' if ffmpeg_disponivel else 'm4a'
+        else:
+            cache_path = os.path.join(base_path, 'cache', 'musicas')
+            tipo = 'playlist'
+            formato = 'mp3' if ffmpeg_disponivel else 'm4a'
+        
+        nome_arquivo = f"{video_hash}.{formato}"
+        arquivo_cache = os.path.join(cache_path, nome_arquivo)
+        
+        # Antes de ir à rede, tenta aproveitar o mesmo vídeo já baixado em outro formato
+        entrada_anterior = cache.get(video_hash)
+        hash_fonte = derivar_do_cache(video_id, video_hash, cache, formato, arquivo_cache, ffmpeg_disponivel, pipeline)
+        if hash_fonte:
+            registrar_no_cache(cache, video_hash, {
+                'id': video_id,
+                'title': video_title,
+                'formato': formato,
+                'arquivo_cache': arquivo_cache,
+                'tipo': tipo,
+                'ultimo_acesso': time.time(),
+                'acessos': 1,
+                'derivado_de': hash_fonte,
+                **assinatura_arquivo(arquivo_cache)
+            })
+            # Um M4A convertido para MP3 na mesma entrada deixa de ser necessário
+            if (entrada_anterior and hash_fonte == video_hash and entrada_anterior.get('formato') != formato
+                    and entrada_anterior['arquivo_cache'] != arquivo_cache):
+                try:
+                    os.remove(entrada_anterior['arquivo_cache'])
+                except OSError:
+                    pass
+            return True, None
+        
+        opcoes_comuns = {
+            'quiet': True,
+            'no_warnings': True,
+            'nocheckcertificate': True,
+            'user_agent': 'Mozilla/5.0 (Linux; Android 10) AppleWebKit/537.36',
+            'referer': 'https://www.youtube.com/',
+            'continuedl': True,
+            'retries': 3,
+            'fragment_retries': 3,
+        }
+        
+        staging_path = os.path.join(base_path, 'cache', 'staging')
+        
+        # Cada perfil tem opções fixas (o arquivo em staging usa o ID do vídeo),
+        # para que a mesma instância do YoutubeDL sirva para todos os itens
+        if formato_video == 'mp4' and is_individual:
+            perfil = 'mp4' if conexoes <= 1 else f'mp4_{conexoes}_conexoes'
+            formato_ydl = 'best[ext=mp4]/best'
+        elif ffmpeg_disponivel and formato_video == 'mp3':
+            # Etapa 1 baixa o áudio original para a pasta staging; a conversão
+            # para MP3 é a etapa 2, feita fora do limite de downloads simultâneos
+            perfil = 'audio'
+            formato_ydl = 'bestaudio/best'
+        else:
+            perfil = 'm4a'
+            formato_ydl = 'bestaudio[ext=m4a]/bestaudio'
+        
+        ydl_opts = {
+            'format': formato_ydl,
+            'outtmpl': os.path.join(staging_path, perfil, '%(id)s.%(ext)s'),
+            **opcoes_comuns
+        }
+        
+        video_url = f"https://www.youtube.com/watch?v={video_id}"
+        
+        controle = pipeline.controle if pipeline else None
+        with pipeline.rede() if pipeline else nullcontext():
+            ydl = sessao.ydl(perfil, ydl_opts)
+            if perfil.startswith('mp4_'):
+                arquivo_baixado, _ = _baixar_mp4_em_conexoes(
+                    ydl, video_url, os.path.join(staging_path, perfil), conexoes, controle, sessao.metricas)
+            else:
+                # Extração e download separados, para que cada um seja medido no rastreamento
+                with rastrear('extract_info', video=video_id):
+                    info = ydl.extract_info(video_url, download=False)
+                
+                def _transferir(banda):
+                    with rastrear('download', video=video_id) as etapa:
+                        arquivo = _arquivo_baixado(ydl, ydl.process_ie_result(info, download=True))
+                        etapa.marcar(bytes=os.path.getsize(arquivo))
+                    return arquivo
+                
+                arquivo_baixado = controle.transferir(ydl, _transferir) if controle else _transferir(None)
+        
+        
+        if formato == 'mp3':
+            if ao_converter:
+                ao_converter()
+            if pipeline:
+                pipeline.converter(arquivo_baixado, arquivo_cache)
+            else:
+                converter_para_mp3(arquivo_baixado, arquivo_cache)
+            # O original só é apagado depois da conversão; se ela falhar, a
+            # retentativa reaproveita o arquivo já baixado
+            os.remove(arquivo_baixado)
+        else:
+            os.replace(arquivo_baixado, arquivo_cache)
+        
+        registrar_no_cache(cache, video_hash, {
+            'id': video_id,
+            'title': video_title,
+            'formato': formato,
+            'arquivo_cache': arquivo_cache,
+            'tipo': tipo,
+            'ultimo_acesso': time.time(),
+            'acessos': 1,
+            **assinatura_arquivo(arquivo_cache)
+        })
+        concluir_retentativa(video_hash)
+        return True, None
+        
+    except Exception as e:
+        erro_str = str(e)
+        if pipeline:
+            pipeline.controle.registrar_erro(erro_str)
+        if not erro_permanente(erro_str):
+            agendar_retentativa(video_hash, {
+                'video_id': video_id,
+                'title': video_title,
+                'is_individual': is_individual,
+                'formato_video': formato_video,
+                'destino': destino,
+            }, erro_str)
+        if '429' in erro_str or 'too many requests' in erro_str.lower():
+            return False, "Erro 429: muitas requisições, reduzindo o ritmo"
+        if '403' in erro_str or 'forbidden' in erro_str.lower():
+            return False, "Erro 403: Atualize o yt-dlp"
+        return False, f"Erro: {erro_str[:100]}"
+    finally:
+        if sessao_propria:
+            sessao.fechar()
+
+def baixar_uma_vez(video_hash, funcao):
+    """Executa funcao() uma única vez por video_hash entre todos os jobs em andamento
+    
+    Quem pede o mesmo vídeo enquanto ele ainda está sendo baixado (por outra
+    playlist da fila, por exemplo) espera e recebe o mesmo (sucesso, erro).
+    """
+    with _downloads_lock:
+        futuro = _downloads_em_andamento.get(video_hash)
+        dono = futuro is None
+        if dono:
+            futuro = Future()
+            _downloads_em_andamento[video_hash] = futuro
+    
+    if not dono:
+        return futuro.result()
+    
+    try:
+        resultado = funcao()
+        futuro.set_result(resultado)
+        return resultado
+    except BaseException as e:
+        futuro.set_exception(e)
+        raise
+    finally:
+        with _downloads_lock:
+            _downloads_em_andamento.pop(video_hash, None)
+
+class LimiteVagas:
+    """Semáforo cujo limite pode ser alterado enquanto está em uso
+    
+    Reduzir o limite não interrompe quem já tem vaga; só impede novas entradas
+    até que o número em uso fique abaixo do novo limite.
+    """
+    
+    def __init__(self, limite):
+        self.limite = max(1, limite)
+        self._em_uso = 0
+        self._condicao = threading.Condition()
+    
+    @property
+    def em_uso(self):
+        return self._em_uso
+    
+    def definir(self, limite):
+        with self._condicao:
+            self.limite = max(1, limite)
+            self._condicao.notify_all()
+    
+    def __enter__(self):
+        with self._condicao:
+            while self._em_uso >= self.limite:
+                self._condicao.wait()
+            self._em_uso += 1
+        return self
+    
+    def __exit__(self, *exc):
+        with self._condicao:
+            self._em_uso -= 1
+            self._condicao.notify()
+        return False
+
+class FatiaBanda:
+    """Parte do limite_banda que cabe a um download em andamento (None = sem limite)"""
+    
+    def __init__(self, params=None):
+        self.params = params
+        self.limite = None
+        self.minimo = None
+    
+    def definir(self, limite):
+        self.limite = limite
+        if limite is not None:
+            self.minimo = limite if self.minimo is None else min(self.minimo, limite)
+        if self.params is not None:
+            if limite:
+                self.params['ratelimit'] = limite
+            else:
+                self.params.pop('ratelimit', None)
+
+class ControleAdaptativo:
+    """Ajusta as vagas de rede e o ritmo das requisições pelo retorno do YouTube (AIMD)
+    
+    Cada download concluído em velocidade normal soma 1/limite à janela de
+    concorrência (cerca de uma vaga a mais por rodada de downloads) e reduz a
+    espera entre requisições. Um bloqueio (403, 429, timeout) ou um download
+    estrangulado corta a janela pela metade e dobra a espera. A janela nunca
+    passa do teto escolhido pelo usuário nem fica abaixo de 1.
+    
+    limite_banda (bytes/s) é dividido entre os downloads que estão
+    transferindo (ver limitar_banda) e redividido sempre que um começa ou
+    termina; no yt-dlp ele vira o 'ratelimit', lido a cada bloco recebido.
+    """
+    
+    def __init__(self, vagas, configuracoes=None):
+        configuracoes = configuracoes or carregar_configuracoes()
+        self.vagas = vagas
+        self.teto = vagas.limite
+        self.adaptativo = bool(configuracoes.get('concorrencia_adaptativa', True))
+        self.limite_banda = configuracoes.get('limite_banda')
+        self.intervalo = 0.0
+        self.bloqueios = 0
+        self.estrangulados = 0
+        self._janela = float(vagas.limite)
+        self._proxima_requisicao = 0.0
+        self._ultimo_corte = float('-inf')
+        self._transferindo = []
+        self._lock = threading.Lock()
+    
+    def definir_teto(self, teto):
+        with self._lock:
+            if teto == self.teto:
+                return
+            self.teto = teto
+            self._janela = float(teto)
+            self.vagas.definir(teto)
+    
+    def aguardar_vez(self):
+        """Espaça o início das requisições conforme o intervalo atual"""
+        with self._lock:
+            agora = time.monotonic()
+            inicio = max(agora, self._proxima_requisicao)
+            self._proxima_requisicao = inicio + self.intervalo
+        if inicio > agora:
+            time.sleep(inicio - agora)
+    
+    @contextmanager
+    def limitar_banda(self, ydl=None):
+        """Registra um download enquanto ele transfere e retorna a sua FatiaBanda
+        
+        O 'ratelimit' do ydl (se houver) acompanha a fatia atual.
+        """
+        fatia = FatiaBanda(ydl.params if ydl is not None else None)
+        with self._lock:
+            self._transferindo.append(fatia)
+            self._redistribuir()
+        try:
+            yield fatia
+        finally:
+            with self._lock:
+                self._transferindo.remove(fatia)
+                self._redistribuir()
+    
+    def transferir(self, ydl, funcao):
+        """Executa funcao(fatia) dentro de limitar_banda e registra a velocidade
+        
+        funcao faz só a transferência e retorna o caminho do arquivo baixado;
+        a extração e as consultas antes dela não ocupam fatia do limite_banda
+        nem entram na medida de velocidade do AIMD.
+        """
+        inicio = time.monotonic()
+        with self.limitar_banda(ydl) as fatia:
+            arquivo = funcao(fatia)
+        self.registrar_sucesso(os.path.getsize(arquivo), time.monotonic() - inicio, fatia.minimo)
+        return arquivo
+    
+    def _redistribuir(self):
+        # Chamado com o lock
+        limite = None
+        if self.limite_banda and self._transferindo:
+            limite = max(1, int(self.limite_banda / len(self._transferindo)))
+        for fatia in self._transferindo:
+            fatia.definir(limite)
+    
+    def registrar_sucesso(self, num_bytes, segundos, limite=None):
+        """limite é o menor limite de banda que o download teve (FatiaBanda.minimo)"""
+        if num_bytes >= AIMD_BYTES_MINIMOS and segundos > 0 and num_bytes / segundos < VELOCIDADE_ESTRANGULADA:
+            # Lentidão causada pelo próprio limite de banda não é estrangulamento
+            if limite is None or limite > VELOCIDADE_ESTRANGULADA:
+                with self._lock:
+                    self.estrangulados += 1
+                self._reduzir()
+                return
+        
+        if not self.adaptativo:
+            return
+        with self._lock:
+            self._janela = min(float(self.teto), self._janela + 1.0 / max(self._janela, 1.0))
+            self.intervalo = max(0.0, self.intervalo - AIMD_PASSO_INTERVALO)
+            self.vagas.definir(int(self._janela))
+    
+    def registrar_erro(self, erro_str):
+        erro_str = erro_str.lower()
+        if not any(trecho in erro_str for trecho in ERROS_BLOQUEIO):
+            return
+        with self._lock:
+            self.bloqueios += 1
+        self._reduzir()
+    
+    def _reduzir(self):
+        if not self.adaptativo:
+            return
+        with self._lock:
+            agora = time.monotonic()
+            if agora - self._ultimo_corte < AIMD_CARENCIA_CORTE:
+                return
+            self._ultimo_corte = agora
+            self._janela = max(1.0, self._janela / 2)
+            self.intervalo = min(AIMD_INTERVALO_MAXIMO, max(AIMD_INTERVALO_BASE, self.intervalo * 2))
+            self.vagas.definir(int(self._janela))
+    
+    def resumo(self):
+        with self._lock:
+            return {
+                'limite': self.vagas.limite,
+                'teto': self.teto,
+                'intervalo_s': round(self.intervalo, 2),
+                'limite_banda_bps': self.limite_banda,
+                'bloqueios': self.bloqueios,
+                'estrangulados': self.estrangulados,
+            }
+
+class PoolDownloads:
+    """Workers, vagas de rede e conversores compartilhados pelos jobs do Escalonador
+    
+    Cada job continua com a própria sessão e Metricas (um PipelineDownload
+    criado por pipeline()), mas os downloads de todos disputam as mesmas
+    vagas de rede, cujo total pode ser alterado com definir_num_workers().
+    """
+    
+    def __init__(self, num_workers=NUM_WORKERS_PADRAO, num_conversores=None, jobs_simultaneos=JOBS_SIMULTANEOS):
+        self.vagas_rede = LimiteVagas(num_workers)
+        self.controle = ControleAdaptativo(self.vagas_rede)
+        self.num_conversores = num_conversores or os.cpu_count() or 2
+        self.conversores = ThreadPoolExecutor(max_workers=self.num_conversores)
+        # Threads a mais só aguardam vaga de rede, então o pool comporta o máximo de workers
+        self.executor = ThreadPoolExecutor(
+            max_workers=(NUM_WORKERS_MAXIMO + self.num_conversores) * max(1, jobs_simultaneos))
+    
+    @property
+    def num_workers(self):
+        """Downloads simultâneos escolhidos pelo usuário (o ControleAdaptativo pode usar menos)"""
+        return self.controle.teto
+    
+    def definir_num_workers(self, num_workers):
+        self.controle.definir_teto(normalizar_num_workers(num_workers))
+    
+    def pipeline(self, sessao=None, metricas=None):
+        return PipelineDownload(self.num_workers, sessao=sessao, metricas=metricas, pool=self)
+    
+    def encerrar(self):
+        self.executor.shutdown(wait=True)
+        self.conversores.shutdown(wait=True)
+
+class PipelineDownload:
+    """Separa as etapas de rede e de conversão (FFmpeg) de um job
+    
+    No máximo num_workers downloads usam a rede ao mesmo tempo, enquanto até
+    num_conversores processos do FFmpeg convertem os arquivos já baixados.
+    O tempo gasto em cada etapa é acumulado nas Metricas do job.
+    Com um PoolDownloads, as vagas de rede, o ControleAdaptativo e os
+    conversores são os do pool.
+    """
+    
+    def __init__(self, num_workers, num_conversores=None, sessao=None, metricas=None, pool=None):
+        self.num_workers = num_workers
+        self.metricas = metricas or (sessao.metricas if sessao else None) or Metricas()
+        self.metricas.num_workers = num_workers
+        self._sessao_propria = sessao is None
+        self.sessao = sessao or SessaoDownload(self.metricas)
+        self.pool = pool
+        if pool is None:
+            self.num_conversores = num_conversores or os.cpu_count() or 2
+            self._vagas_rede = LimiteVagas(num_workers)
+            self.controle = ControleAdaptativo(self._vagas_rede)
+            self._conversores = ThreadPoolExecutor(max_workers=self.num_conversores)
+        else:
+            self.num_conversores = pool.num_conversores
+            self._vagas_rede = pool.vagas_rede
+            self.controle = pool.controle
+            self._conversores = pool.conversores
+        self.metricas.controle = self.controle
+    
+    @property
+    def num_threads(self):
+        """Threads necessárias para manter a rede ocupada enquanto outros itens convertem"""
+        return self.num_workers + self.num_conversores
+    
+    @contextmanager
+    def etapa(self, nome):
+        inicio = time.monotonic()
+        try:
+            yield
+        finally:
+            self.metricas.registrar_etapa(nome, time.monotonic() - inicio)
+    
+    @contextmanager
+    def rede(self):
+        with self._vagas_rede:
+            with self.etapa('rede'):
+                self.controle.aguardar_vez()
+                yield
+    
+    def converter(self, origem, destino):
+        def _converter():
+            with self.etapa('conversao'):
+                converter_para_mp3(origem, destino)
+        return self._conversores.submit(propagar_rastreamento(_converter)).result()
+    
+    def resumo_tempos(self):
+        tempos = self.metricas.resumo()['tempos_etapas_s']
+        return ' | '.join(f'{nome}: {segundos:.1f}s' for nome, segundos in tempos.items())
+    
+    def encerrar(self):
+        if self.pool is None:
+            self._conversores.shutdown(wait=True)
+        if self._sessao_propria:
+            self.sessao.fechar()
+
+class ItemPlaylist:
+    """Um vídeo da playlist e o estado atual do seu processamento"""
+    
+    def __init__(self, indice, video_id, titulo):
+        self.indice = indice
+        self.video_id = video_id
+        self.titulo = titulo
+        self.video_hash = gerar_id_video(video_id, 'mp3')
+        self.estado = ESTADO_NA_FILA
+        self.resultado = None
+        self.erro = None
+        self.metodo = None
+        self.bytes_economizados = 0
+        self.arquivo = None
+
+def processar_item_playlist(item, cache, output_path, ffmpeg_disponivel, modo=MATERIALIZACAO_AUTO, pipeline=None):
+    """Executa todas as etapas de um item da playlist dentro de um worker
+    
+    Com rastreamento nas Metricas do pipeline, as etapas do item são medidas
+    com o ID do vídeo.
+    Retorna 'copiado' (já estava no cache ou foi baixado por outro job), 'baixado' ou 'erro'.
+    """
+    rastreamento = pipeline.metricas.rastreamento if pipeline else None
+    with rastreamento.ativar(video=item.video_id) if rastreamento else nullcontext():
+        return _executar_item_playlist(item, cache, output_path, ffmpeg_disponivel, modo, pipeline)
+
+def _executar_item_playlist(item, cache, output_path, ffmpeg_disponivel, modo, pipeline):
+    if entrada_atende(cache.get(item.video_hash), 'mp3', ffmpeg_disponivel):
+        item.estado = ESTADO_COPIANDO
+        if _materializar_item(item, cache, output_path, modo, pipeline):
+            item.estado = ESTADO_CONCLUIDO
+            item.resultado = 'copiado'
+            return item.resultado
+    
+    item.estado = ESTADO_BAIXANDO
+    baixou = False
+    
+    def _baixar():
+        nonlocal baixou
+        # Outro job pode ter terminado este vídeo desde a verificação acima
+        if entrada_atende(cache.get(item.video_hash), 'mp3', ffmpeg_disponivel):
+            return True, None
+        baixou = True
+        return download_para_cache(
+            item.video_id, item.titulo, item.video_hash, cache, ffmpeg_disponivel, False,
+            ao_converter=lambda: setattr(item, 'estado', ESTADO_CONVERTENDO), pipeline=pipeline,
+            destino={'output_path': output_path, 'modo': modo})
+    
+    sucesso, erro = baixar_uma_vez(item.video_hash, _baixar)
+    # Gerado a partir de outro formato já no cache (derivar_do_cache): não houve download
+    if sucesso and baixou and (cache.get(item.video_hash) or {}).get('derivado_de'):
+        baixou = False
+    
+    if sucesso:
+        item.estado = ESTADO_COPIANDO
+        if _materializar_item(item, cache, output_path, modo, pipeline):
+            item.estado = ESTADO_CONCLUIDO
+            item.resultado = 'baixado' if baixou else 'copiado'
+            return item.resultado
+        erro = 'Falha ao copiar do cache'
+    
+    item.estado = ESTADO_FALHOU
+    item.erro = erro
+    item.resultado = 'erro'
+    return item.resultado
+
+def _materializar_item(item, cache, output_path, modo, pipeline=None):
+    """Copia/liga o arquivo do item e registra quantos bytes deixaram de ser duplicados"""
+    with pipeline.etapa('copia') if pipeline else nullcontext():
+        metodo = copiar_do_cache(item.video_hash, item.titulo, output_path, cache, modo)
+    if not metodo:
+        return False
+    
+    item.metodo = metodo
+    item.arquivo = nome_arquivo_playlist(item.titulo, cache[item.video_hash]['arquivo_cache'])
+    if metodo != MATERIALIZACAO_COPIA:
+        try:
+            item.bytes_economizados = os.path.getsize(cache[item.video_hash]['arquivo_cache'])
+        except OSError:
+            pass
+    return True
+
+def carregar_manifesto(output_path):
+    """Carrega o manifesto da pasta da playlist: {video_id: {arquivo, tamanho, mtime}}"""
+    caminho = os.path.join(output_path, MANIFESTO_ARQUIVO)
+    try:
+        if os.path.exists(caminho):
+            with open(caminho, 'r', encoding='utf-8') as f:
+                return json.load(f).get('itens', {})
+    except Exception as e:
+        print(f"Erro ao carregar manifesto: {e}")
+    return {}
+
+def salvar_manifesto(output_path, itens):
+    """Grava o manifesto da pasta da playlist de forma atômica"""
+    try:
+        _escrever_json_atomico(os.path.join(output_path, MANIFESTO_ARQUIVO), {'versao': 1, 'itens': itens})
+    except Exception as e:
+        print(f"Erro ao salvar manifesto: {e}")
+
+def atualizar_manifesto(output_path, funcao):
+    """Relê o manifesto da pasta, aplica funcao(itens) e grava, com a pasta travada
+    
+    Outro job (ou a fila de retentativas) pode ter gravado no mesmo manifesto
+    desde a última leitura; cada um altera só as próprias entradas.
+    """
+    with _manifestos_lock:
+        lock = _manifestos_locks.setdefault(os.path.realpath(output_path), threading.Lock())
+    with lock:
+        itens = carregar_manifesto(output_path)
+        funcao(itens)
+        salvar_manifesto(output_path, itens)
+
+def registrar_no_manifesto(manifesto, item, output_path):
+    """Anota no manifesto o arquivo que acabou de ser colocado na pasta da playlist
+    
+    Se o vídeo estava na pasta com outro nome (ex.: Faixa.m4a convertida para
+    Faixa.mp3), o arquivo antigo é apagado.
+    """
+    try:
+        info = os.stat(os.path.join(output_path, item.arquivo))
+    except (OSError, TypeError):
+        return
+    
+    anterior = (manifesto.get(item.video_id) or {}).get('arquivo')
+    if anterior and anterior != item.arquivo and not any(
+            registro.get('arquivo') == anterior for chave, registro in manifesto.items() if chave != item.video_id):
+        try:
+            caminho = os.path.join(output_path, anterior)
+            if os.path.lexists(caminho):
+                os.remove(caminho)
+        except OSError as e:
+            print(f"Erro ao remover {anterior}: {e}")
+    
+    manifesto[item.video_id] = {
+        'arquivo': item.arquivo,
+        'video_hash': item.video_hash,
+        'tamanho': info.st_size,
+        'mtime': info.st_mtime,
+    }
+
+def arquivo_sincronizado(registro, output_path):
+    """Indica se o arquivo anotado no manifesto continua na pasta, sem alterações"""
+    if not registro:
+        return False
+    try:
+        info = os.stat(os.path.join(output_path, registro['arquivo']))
+    except (OSError, KeyError):
+        return False
+    return info.st_size == registro.get('tamanho') and info.st_mtime == registro.get('mtime')
+
+def remover_ausentes_da_pasta(manifesto, output_path, ids_presentes):
+    """Apaga da pasta os arquivos de vídeos que saíram da playlist e retorna quantos foram removidos"""
+    removidos = 0
+    for video_id in [v for v in manifesto if v not in ids_presentes]:
+        registro = manifesto.pop(video_id)
+        caminho = os.path.join(output_path, registro.get('arquivo', ''))
+        try:
+            if registro.get('arquivo') and os.path.lexists(caminho):
+                os.remove(caminho)
+            removidos += 1
+        except OSError as e:
+            print(f"Erro ao remover {caminho}: {e}")
+    return removidos
+
+def hashes_referenciados_por_playlists():
+    """Conjunto de video_hash que algum manifesto de playlist ainda referencia"""
+    pasta_playlists = os.path.join(criar_estrutura_pastas(), 'playlists')
+    referenciados = set()
+    try:
+        nomes = os.listdir(pasta_playlists)
+    except OSError:
+        return referenciados
+    for nome in nomes:
+        output_path = os.path.join(pasta_playlists, nome)
+        if os.path.isdir(output_path):
+            referenciados.update(r.get('video_hash') for r in carregar_manifesto(output_path).values())
+    return referenciados
+
+def liberar_espaco_cache(cache, configuracoes=None):
+    """Remove entradas do cache até que cada pasta e o total caibam nos limites configurados
+    
+    A ordem de remoção segue a política 'lru' ou 'lfu'. Arquivos referenciados
+    pelo manifesto de alguma playlist e arquivos usados recentemente nunca são
+    removidos. Retorna (quantidade de arquivos removidos, bytes liberados).
+    """
+    if configuracoes is None:
+        configuracoes = carregar_configuracoes()
+    limites = configuracoes.get('limites_cache') or {}
+    limite_total = configuracoes.get('limite_cache_total')
+    if limite_total is None and not any(v is not None for v in limites.values()):
+        return 0, 0
+    
+    referenciados = hashes_referenciados_por_playlists()
+    agora = time.time()
+    
+    with _cache_lock:
+        itens = list(cache.items())
+    
+    uso_por_pasta = {}
+    candidatos = []
+    for video_hash, entrada in itens:
+        arquivo = entrada.get('arquivo_cache')
+        try:
+            tamanho = os.path.getsize(arquivo)
+        except (OSError, TypeError):
+            continue
+        pasta = os.path.basename(os.path.dirname(arquivo))
+        uso_por_pasta[pasta] = uso_por_pasta.get(pasta, 0) + tamanho
+        
+        ultimo_acesso = entrada.get('ultimo_acesso') or os.path.getmtime(arquivo)
+        if video_hash in referenciados or agora - ultimo_acesso < LIMPEZA_CACHE_CARENCIA:
+            continue
+        candidatos.append((video_hash, pasta, tamanho, ultimo_acesso, entrada.get('acessos', 0)))
+    
+    if configuracoes.get('politica_cache') == 'lfu':
+        candidatos.sort(key=lambda c: (c[4], c[3]))
+    else:
+        candidatos.sort(key=lambda c: c[3])
+    
+    uso_total = sum(uso_por_pasta.values())
+    removidos = liberados = 0
+    
+    def _acima_do_limite(pasta):
+        limite_pasta = limites.get(pasta)
+        return ((limite_pasta is not None and uso_por_pasta[pasta] > limite_pasta) or
+                (limite_total is not None and uso_total > limite_total))
+    
+    for video_hash, pasta, tamanho, _, _ in candidatos:
+        if not _acima_do_limite(pasta):
+            continue
+        try:
+            os.remove(cache[video_hash]['arquivo_cache'])
+        except KeyError:
+            continue
+        except OSError as e:
+            print(f"Erro ao remover do cache: {e}")
+            continue
+        remover_do_cache(cache, video_hash)
+        uso_por_pasta[pasta] -= tamanho
+        uso_total -= tamanho
+        removidos += 1
+        liberados += tamanho
+    
+    return removidos, liberados
+
+def _executar_limpeza_cache():
+    while True:
+        configuracoes = carregar_configuracoes()
+        try:
+            removidos, liberados = liberar_espaco_cache(carregar_cache(), configuracoes)
+            if removidos:
+                print(f"Cache: {removidos} arquivos removidos ({formatar_bytes(liberados)})")
+        except Exception as e:
+            print(f"Erro na limpeza do cache: {e}")
+        _limpeza_evento.wait(configuracoes.get('intervalo_limpeza_cache') or CONFIGURACOES_PADRAO['intervalo_limpeza_cache'])
+        _limpeza_evento.clear()
+
+def iniciar_limpeza_cache():
+    """Inicia (uma vez) a thread que mantém o cache dentro dos limites em segundo plano"""
+    global _limpeza_thread
+    if _limpeza_thread is None:
+        _limpeza_thread = threading.Thread(target=_executar_limpeza_cache, daemon=True)
+        _limpeza_thread.start()
+    return _limpeza_thread
+
+def solicitar_limpeza_cache():
+    """Pede à thread de limpeza que verifique os limites agora (ex.: ao fim de um download)"""
+    _limpeza_evento.set()
+
+def _dados_retentativa(entrada):
+    """Dados para baixar de novo, pela fila de retentativas, o vídeo de uma entrada do cache"""
+    tipo = entrada.get('tipo')
+    return {
+        'video_id': entrada['id'],
+        'title': entrada.get('title', 'Sem título'),
+        'is_individual': tipo != 'playlist',
+        'formato_video': 'mp4' if tipo == 'individual_mp4' else 'mp3',
+        'destino': None,
+    }
+
+def verificar_cache(cache, limite_bps=VERIFICACAO_CACHE_BYTES_POR_SEGUNDO, parar=None):
+    """Confere existência, tamanho e checksum dos arquivos do cache
+    
+    Entradas sem arquivo são tiradas do índice; arquivos com tamanho ou
+    checksum diferentes do registrado são apagados. Nos dois casos o vídeo vai
+    para a fila de retentativas para ser baixado de novo. Entradas de versões
+    anteriores ganham tamanho, mtime e checksum. Cada entrada é conferida no
+    máximo uma vez por VERIFICACAO_CACHE_INTERVALO, e a verificação espera
+    enquanto houver downloads em andamento.
+    Retorna {'verificados', 'atualizados', 'removidos'}.
+    """
+    resultado = {'verificados': 0, 'atualizados': 0, 'removidos': 0}
+    agora = time.time()
+    with _cache_lock:
+        itens = list(cache.items())
+    
+    for video_hash, entrada in itens:
+        if parar is not None and parar.is_set():
+            break
+        if agora - entrada.get('verificado_em', 0) < VERIFICACAO_CACHE_INTERVALO:
+            continue
+        while _downloads_em_andamento:
+            time.sleep(5)
+        
+        problema = None
+        checksum = None
+        arquivo = entrada.get('arquivo_cache')
+        try:
+            info = os.stat(arquivo)
+        except (OSError, TypeError):
+            problema = 'ausente'
+        else:
+            if entrada.get('tamanho') is not None and info.st_size != entrada['tamanho']:
+                problema = 'tamanho diferente'
+            else:
+                checksum = calcular_checksum(arquivo, limite_bps)
+                if entrada.get('checksum') and checksum != entrada['checksum']:
+                    problema = 'checksum diferente'
+        
+        with _cache_lock:
+            # A entrada pode ter sido baixada de novo ou removida durante a leitura
+            if cache.get(video_hash) is not entrada:
+                continue
+            resultado['verificados'] += 1
+            
+            if problema is None:
+                if entrada.get('checksum') is None:
+                    resultado['atualizados'] += 1
+                registrar_no_cache(cache, video_hash, dict(
+                    entrada, tamanho=info.st_size, mtime=info.st_mtime, checksum=checksum, verificado_em=time.time()))
+                continue
+            
+            if problema != 'ausente':
+                try:
+                    os.remove(arquivo)
+                except OSError as e:
+                    print(f"Erro ao remover arquivo corrompido: {e}")
+            remover_do_cache(cache, video_hash)
+            resultado['removidos'] += 1
+        
+        print(f"Cache: {entrada.get('title', video_hash)[:40]} ({problema})")
+        if entrada.get('id'):
+            agendar_retentativa(video_hash, _dados_retentativa(entrada), f'Arquivo do cache: {problema}')
+    
+    return resultado
+
+def _executar_verificacao_cache(log):
+    # Prioridade baixa só para esta thread (no Linux/Android cada thread tem a sua)
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+    
+    time.sleep(VERIFICACAO_CACHE_ATRASO_INICIAL)
+    while True:
+        try:
+            resultado = verificar_cache(carregar_cache())
+            if resultado['removidos']:
+                log(f"Cache: {resultado['removidos']} arquivos ausentes ou corrompidos serão baixados de novo")
+                iniciar_retentativas_pendentes(log)
+        except Exception as e:
+            print(f"Erro na verificação do cache: {e}")
+        time.sleep(VERIFICACAO_CACHE_REPETICAO)
+
+def iniciar_verificacao_cache(log=print):
+    """Inicia (uma vez) a thread que confere os arquivos do cache em segundo plano"""
+    global _verificacao_thread
+    if _verificacao_thread is None:
+        _verificacao_thread = threading.Thread(target=_executar_verificacao_cache, args=(log,), daemon=True)
+        _verificacao_thread.start()
+    return _verificacao_thread
+
+def normalizar_num_workers(valor):
+    """Converte o valor informado pelo usuário em uma quantidade válida de workers"""
+    try:
+        num = int(valor)
+    except (TypeError, ValueError):
+        return NUM_WORKERS_PADRAO
+    return max(1, min(num, NUM_WORKERS_MAXIMO))
+
+_MARKUP_KIVY = re.compile(r'\[/?(?:b|i|u|s|color|size|font)(?:=[^\]]*)?\]')
+
+def remover_markup(texto):
+    """Remove as tags de markup do Kivy ([b], [color=...]) de uma mensagem de log"""
+    return _MARKUP_KIVY.sub('', texto)
+
+def preparar_url(url):
+    """Completa o esquema da URL e troca mixes automáticos (list=RD) pelo vídeo
+    
+    Retorna (url, aviso), onde aviso é uma mensagem para o log ou None.
+    """
+    url = url.strip()
+    aviso = None
+    
+    if not url.startswith('http'):
+        if url.startswith('www.') or url.startswith('youtube.com') or url.startswith('youtu.be'):
+            url = 'https://' + url
+    
+    if '?list=RD' in url or '&list=RD' in url:
+        video_match = re.search(r'(?:v=|youtu\.be/)([a-zA-Z0-9_-]{11})', url)
+        if video_match:
+            video_id = video_match.group(1)
+            url = f'https://www.youtube.com/watch?v={video_id}'
+            aviso = '[color=ffaa00]Playlist automática detectada - usando vídeo individual[/color]'
+    
+    return url, aviso
+
+class ObservadorJob:
+    """Recebe o andamento de um job
+    
+    A interface e a linha de comando sobrescrevem os métodos que usam; por
+    padrão as mensagens vão para a saída padrão e o resto é ignorado.
+    """
+    
+    def log(self, mensagem):
+        print(remover_markup(mensagem))
+    
+    def status(self, mensagem):
+        pass
+    
+    def progresso(self, valor=None, maximo=None):
+        pass
+    
+    def download_unico(self, ativo):
+        """Início/fim do download de um vídeo individual (progresso disponível nas Metricas)"""
+        pass
+
+def download_video(info, formato, sessao=None, observador=None, pipeline=None):
+    """Baixa um vídeo individual (ou clip) para o cache
+    
+    Com um pipeline, o download ocupa uma das vagas de rede dele.
+    Retorna um dict com 'sucesso', 'arquivo', 'do_cache' e 'erro'.
+    """
+    observador = observador or ObservadorJob()
+    cache = carregar_cache()
+    metricas = sessao.metricas if sessao else None
+    
+    video_id = info.get('id', '')
+    video_title = info.get('title', 'Sem título')
+    video_hash = gerar_id_video(video_id, formato)
+    ffmpeg_disponivel = verificar_ffmpeg()
+    conexoes = max(1, min(int(carregar_configuracoes().get('conexoes_por_video') or 1), NUM_WORKERS_MAXIMO))
+    resultado = {'tipo': 'video', 'id': video_id, 'titulo': video_title, 'formato': formato,
+                 'sucesso': False, 'arquivo': None, 'do_cache': False, 'erro': None}
+    
+    observador.progresso(maximo=1)
+    
+    if entrada_atende(cache.get(video_hash), formato, ffmpeg_disponivel):
+        arquivo = cache[video_hash]['arquivo_cache']
+        registrar_acesso_cache(cache, video_hash)
+        if metricas:
+            metricas.registrar_cache(True)
+        observador.log('[color=00ff00]Já está no cache![/color]')
+        observador.progresso(valor=1)
+        resultado.update(sucesso=True, arquivo=arquivo, do_cache=True)
+        return resultado
+    
+    observador.log('Baixando...')
+    if metricas:
+        metricas.registrar_cache(False)
+    observador.download_unico(True)
+    rastreamento = metricas.rastreamento if metricas else None
+    try:
+        with rastreamento.ativar(video=video_id) if rastreamento else nullcontext():
+            sucesso, erro = baixar_uma_vez(video_hash, lambda: download_para_cache(
+                video_id, video_title, video_hash, cache, ffmpeg_disponivel, True, formato, pipeline=pipeline,
+                sessao=sessao, conexoes=conexoes))
+    finally:
+        observador.download_unico(False)
+    
+    if sucesso:
+        arquivo = cache[video_hash].get('arquivo_cache')
+        relatorio = metricas.download_paralelo if metricas else None
+        if relatorio and relatorio.get('aceleracao'):
+            observador.log(f"{relatorio['conexoes']} conexões: {formatar_bytes(relatorio['velocidade_bps'])}/s "
+                           f"({relatorio['aceleracao']:.1f}x uma conexão)")
+        observador.log(f'[color=00ff00]Sucesso![/color]\n{arquivo}')
+        observador.progresso(valor=1)
+        resultado.update(sucesso=True, arquivo=arquivo)
+    else:
+        observador.log(f'[color=ff0000]{erro}[/color]')
+        resultado['erro'] = erro
+    return resultado
+
+def download_playlist(url, nome, num_workers=NUM_WORKERS_PADRAO, modo=MATERIALIZACAO_AUTO, info=None,
+                      sincronizar=False, remover_ausentes=False, sessao=None, observador=None,
+                      pool=None, interromper=None):
+    """Baixa a playlist para playlists/<nome>
+    
+    Com sincronizar=True, vídeos cujo arquivo continua na pasta como anotado
+    no manifesto são pulados (sem rede e sem cópia); com remover_ausentes=True,
+    arquivos de vídeos que saíram da playlist são apagados.
+    Com um PoolDownloads, os itens rodam nos workers compartilhados do pool.
+    Quando o evento interromper é sinalizado, nenhum item novo é enviado; os que
+    já estão em andamento terminam e o resultado sai com 'interrompido'.
+    Retorna um dict com os contadores do job.
+    """
+    observador = observador or ObservadorJob()
+    base_path = criar_estrutura_pastas()
+    output_path = os.path.join(base_path, 'playlists', nome)
+    resultado = {'tipo': 'playlist', 'nome': nome, 'pasta': output_path, 'sucesso': False, 'erro': None}
+    
+    try:
+        if not os.path.exists(output_path):
+            os.makedirs(output_path)
+    except Exception as e:
+        observador.log(f'[color=ff0000]Erro ao criar pasta: {e}[/color]')
+        resultado['erro'] = f'Erro ao criar pasta: {e}'
+        return resultado
+    
+    cache = carregar_cache()
+    ffmpeg_disponivel = verificar_ffmpeg()
+    manifesto = carregar_manifesto(output_path)
+    ids_iniciais = set(manifesto)
+    alterados = set()
+    ids_presentes = set()
+    listagem_completa = False
+    
+    # O total só é conhecido quando o yt-dlp informa ou quando a listagem termina
+    total = None
+    conhecidos = 0
+    
+    def _definir_total(valor):
+        nonlocal total
+        total = valor
+        observador.log(f'Encontrados {valor} vídeos')
+        observador.progresso(maximo=max(valor, 1))
+    
+    observador.log(f'Listando a playlist ({num_workers} downloads simultâneos)\n')
+    
+    copiados = baixados = erros = inalterados = finalizados = 0
+    bytes_economizados = 0
+    metodos = {}
+    
+    itens_falhos = []
+    
+    def _registrar(futuro, item, retentativa=False):
+        nonlocal copiados, baixados, erros, inalterados, finalizados, bytes_economizados
+        if retentativa:
+            # O item já tinha sido contado como erro na rodada anterior
+            erros -= 1
+            finalizados -= 1
+        if futuro is None:
+            resultado_item = item.resultado
+        else:
+            try:
+                resultado_item = futuro.result()
+            except Exception as e:
+                item.estado = ESTADO_FALHOU
+                item.erro = str(e)
+                resultado_item = 'erro'
+        
+        if resultado_item in ('copiado', 'baixado'):
+            registrar_no_manifesto(manifesto, item, output_path)
+            alterados.add(item.video_id)
+        if resultado_item != 'erro':
+            pipeline.metricas.registrar_cache(resultado_item != 'baixado')
+        
+        finalizados += 1
+        if resultado_item == 'inalterado':
+            inalterados += 1
+        elif resultado_item == 'copiado':
+            copiados += 1
+        elif resultado_item == 'baixado':
+            baixados += 1
+        else:
+            erros += 1
+            itens_falhos.append(item)
+        
+        if item.metodo:
+            metodos[item.metodo] = metodos.get(item.metodo, 0) + 1
+            bytes_economizados += item.bytes_economizados
+        
+        posicao = f'{item.indice}/{total}' if total is not None else f'{item.indice}'
+        if resultado_item == 'erro':
+            observador.log(f'[color=ff0000][{posicao}] {item.titulo[:40]}: {item.erro}[/color]')
+        elif resultado_item != 'inalterado':
+            observador.log(f'[{posicao}] {item.titulo[:40]}...')
+        
+        if total is None:
+            observador.progresso(maximo=max(conhecidos, 1))
+            observador.status(f'Processados {finalizados} | {conhecidos} conhecidos até agora')
+        else:
+            observador.status(f'Processados {finalizados}/{total}')
+        observador.progresso(valor=finalizados)
+        pipeline.metricas.registrar_itens(finalizados, total)
+    
+    # Os itens são enviados aos workers conforme as páginas da playlist chegam,
+    # com no máximo 2 itens por worker aguardando, para manter a memória constante
+    if pool is not None:
+        pipeline = pool.pipeline(sessao)
+        workers = nullcontext(pool.executor)
+    else:
+        pipeline = PipelineDownload(num_workers, sessao=sessao)
+        workers = ThreadPoolExecutor(max_workers=pipeline.num_threads)
+    limite_pendentes = pipeline.num_threads * 2
+    pendentes = {}
+    interrompido = False
+    
+    with workers as executor:
+        try:
+            if info is None and sincronizar:
+                info = extrair_info(url, lazy=True, sessao=pipeline.sessao, atualizar=True)
+            for video in iterar_playlist(url, info, _definir_total, pipeline.sessao):
+                if interromper is not None and interromper.is_set():
+                    interrompido = True
+                    break
+                conhecidos += 1
+                ids_presentes.add(video['id'])
+                item = ItemPlaylist(conhecidos, video['id'], video['title'])
+                
+                if sincronizar and arquivo_sincronizado(manifesto.get(video['id']), output_path):
+                    item.estado = ESTADO_CONCLUIDO
+                    item.resultado = 'inalterado'
+                    _registrar(None, item)
+                    continue
+                
+                futuro = executor.submit(processar_item_playlist, item, cache, output_path, ffmpeg_disponivel, modo, pipeline)
+                pendentes[futuro] = item
+                
+                if len(pendentes) >= limite_pendentes:
+                    concluidos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                    for futuro in concluidos:
+                        _registrar(futuro, pendentes.pop(futuro))
+            else:
+                listagem_completa = True
+        except Exception as e:
+            observador.log(f'[color=ff0000]Erro ao obter playlist: {str(e)[:100]}[/color]')
+        
+        # Os contadores só são alterados nesta thread, na ordem em que os itens terminam
+        for futuro in as_completed(list(pendentes)):
+            _registrar(futuro, pendentes.pop(futuro))
+        
+        # Erros temporários (403, timeout...) ganham novas tentativas com espera
+        # exponencial; o que ainda falhar fica na fila persistente de retentativas
+        for rodada in range(0 if interrompido else RETENTATIVAS_NO_JOB):
+            falhos = [i for i in itens_falhos if retentativa_agendada(i.video_hash)]
+            itens_falhos.clear()
+            if not falhos:
+                break
+            espera = calcular_espera_retentativa(rodada, RETENTATIVA_NO_JOB_ESPERA_BASE)
+            observador.log(f'Tentando novamente {len(falhos)} itens em {espera:.0f}s...')
+            time.sleep(espera)
+            for item in falhos:
+                item.estado = ESTADO_NA_FILA
+                item.erro = None
+                pendentes[executor.submit(processar_item_playlist, item, cache, output_path,
+                                          ffmpeg_disponivel, modo, pipeline)] = item
+            for futuro in as_completed(list(pendentes)):
+                _registrar(futuro, pendentes.pop(futuro), retentativa=True)
+    pipeline.encerrar()
+    
+    if conhecidos == 0 and not interrompido:
+        observador.log('[color=ff0000]Erro ao obter playlist[/color]')
+        resultado['erro'] = 'Erro ao obter playlist'
+        return resultado
+    
+    removidos = 0
+    # Só remove quando a listagem terminou, para não apagar músicas de páginas não lidas
+    if remover_ausentes and listagem_completa:
+        removidos = remover_ausentes_da_pasta(manifesto, output_path, ids_presentes)
+    
+    def _mesclar(itens):
+        itens.update({video_id: manifesto[video_id] for video_id in alterados if video_id in manifesto})
+        for video_id in ids_iniciais - set(manifesto):
+            itens.pop(video_id, None)
+    
+    atualizar_manifesto(output_path, _mesclar)
+    
+    if interrompido:
+        observador.log(f'\n[color=ffaa00]Interrompido[/color]')
+    else:
+        observador.log(f'\n[color=00ff00]Concluído![/color]')
+    observador.log(f'Copiados: {copiados} | Baixados: {baixados} | Erros: {erros}')
+    if sincronizar or removidos:
+        observador.log(f'Inalterados: {inalterados} | Removidos: {removidos}')
+    if erros and carregar_fila_retentativas():
+        observador.log('Itens com erro temporário ficaram na fila e serão tentados novamente depois')
+        iniciar_retentativas_pendentes(observador.log, pool)
+    observador.log(f'Tempo por etapa: {pipeline.resumo_tempos()}')
+    if metodos:
+        resumo_metodos = ', '.join(f'{m}: {n}' for m, n in sorted(metodos.items()))
+        observador.log(f'Arquivos ({resumo_metodos}) | Espaço economizado: {formatar_bytes(bytes_economizados)}')
+    
+    resultado.update({
+        'sucesso': True,
+        'total': conhecidos,
+        'listagem_completa': listagem_completa,
+        'copiados': copiados,
+        'baixados': baixados,
+        'erros': erros,
+        'inalterados': inalterados,
+        'removidos': removidos,
+        'metodos': metodos,
+        'bytes_economizados': bytes_economizados,
+        'interrompido': interrompido,
+    })
+    return resultado
+
+def processar_download(url, nome, formato, num_workers=NUM_WORKERS_PADRAO, modo=MATERIALIZACAO_AUTO,
+                       sincronizar=False, remover_ausentes=False, observador=None, metricas=None,
+                       pool=None, interromper=None):
+    """Executa um job completo: detecta o tipo da URL e baixa a playlist ou o vídeo
+    
+    pool e interromper são repassados a download_playlist (ver Escalonador).
+    Com 'rastreamento' nas configurações, as etapas do job são gravadas em
+    cache/rastreamentos e o resultado ganha 'rastreamento' com o resumo.
+    Retorna o dict de download_playlist/download_video, com 'url', 'tipo'
+    ('playlist', 'video' ou None em caso de erro) e 'estatisticas'.
+    """
+    observador = observador or ObservadorJob()
+    # Uma sessão do yt-dlp para o job inteiro: detecção, listagem e downloads
+    if metricas is None:
+        metricas = Metricas(caminho_estatisticas())
+    if metricas.rastreamento is None and carregar_configuracoes().get('rastreamento'):
+        metricas.rastreamento = Rastreamento()
+    rastreamento = metricas.rastreamento
+    sessao = SessaoDownload(metricas)
+    resultado = {'tipo': None, 'sucesso': False, 'erro': None}
+    try:
+        with rastreamento.ativar() if rastreamento else nullcontext():
+            observador.log('\n[b]Detectando tipo...[/b]')
+            # Na sincronização a listagem precisa ser atual, para ver itens novos e removidos
+            tipo, info = detectar_tipo_url(url, sessao, atualizar=sincronizar)
+            
+            if tipo is None:
+                erro = info if isinstance(info, str) else "Erro ao acessar"
+                observador.log(f'[color=ff0000]{erro}[/color]')
+                observador.status('Erro')
+                resultado['erro'] = erro
+            elif tipo == 'playlist':
+                observador.log(f'[color=00ff00]Playlist detectada[/color]')
+                observador.log(f'Título: {info.get("title", "N/A")}')
+                resultado = download_playlist(url, nome, num_workers, modo, info, sincronizar, remover_ausentes,
+                                              sessao, observador, pool, interromper)
+                resultado['titulo'] = info.get('title')
+            else:
+                observador.log(f'[color=00ff00]Vídeo individual detectado[/color]')
+                observador.log(f'Título: {info.get("title", "N/A")}')
+                pipeline = pool.pipeline(sessao) if pool is not None else None
+                resultado = download_video(info, formato, sessao, observador, pipeline)
+            
+    except Exception as e:
+        observador.log(f'[color=ff0000]Erro: {str(e)}[/color]')
+        resultado['erro'] = str(e)
+    finally:
+        sessao.fechar()
+        metricas.salvar(forcar=True)
+        solicitar_limpeza_cache()
+    
+    resultado['url'] = url
+    resultado['estatisticas'] = metricas.resumo()
+    if rastreamento is not None:
+        resultado['rastreamento'] = concluir_rastreamento(rastreamento, resultado.get('tipo'), observador)
+    return resultado
+
+def concluir_rastreamento(rastreamento, tipo, observador=None):
+    """Grava o rastreamento do job em cache/rastreamentos e mostra as etapas mais lentas no log
+    
+    Retorna o resumo (ver Rastreamento.resumo) com o caminho do arquivo em 'arquivo'.
+    """
+    observador = observador or ObservadorJob()
+    resumo = rastreamento.resumo()
+    try:
+        resumo['arquivo'] = caminho_rastreamento(tipo)
+        rastreamento.exportar(resumo['arquivo'])
+    except Exception as e:
+        print(f"Erro ao salvar rastreamento: {e}")
+        resumo['arquivo'] = None
+    observador.log(rastreamento.texto_resumo())
+    if resumo['arquivo']:
+        observador.log(f"Rastreamento: {resumo['arquivo']}")
+    return resumo
+
+def _caminho_fila_trabalhos():
+    return os.path.join(criar_estrutura_pastas(), 'cache', FILA_TRABALHOS_ARQUIVO)
+
+class Escalonador:
+    """Fila de trabalhos (URLs) executada sobre um PoolDownloads compartilhado
+    
+    Os trabalhos rodam por prioridade (maior primeiro) e ordem de chegada, até
+    jobs_simultaneos ao mesmo tempo. Com persistir=True a fila é gravada em
+    cache/fila_trabalhos.json a cada mudança, e trabalhos que estavam rodando
+    quando o app fechou voltam para a fila.
+    
+    Pausar ou cancelar um trabalho em execução só impede que novos itens sejam
+    enviados; os que já estão baixando terminam e ficam no cache. Um trabalho
+    retomado roda com sincronizar=True e pula o que já está na pasta.
+    
+    Callbacks (chamados fora do lock, na thread do trabalho):
+    observador_para(trabalho) -> ObservadorJob, ao_iniciar(trabalho, metricas),
+    ao_concluir(trabalho, resultado) e ao_mudar() a cada alteração da fila.
+    """
+    
+    def __init__(self, num_workers=NUM_WORKERS_PADRAO, jobs_simultaneos=JOBS_SIMULTANEOS, persistir=True,
+                 observador_para=None, ao_iniciar=None, ao_concluir=None, ao_mudar=None):
+        self.pool = PoolDownloads(num_workers, jobs_simultaneos=jobs_simultaneos)
+        self.jobs_simultaneos = max(1, jobs_simultaneos)
+        self.observador_para = observador_para
+        self.ao_iniciar = ao_iniciar
+        self.ao_concluir = ao_concluir
+        self.ao_mudar = ao_mudar
+        self._arquivo = _caminho_fila_trabalhos() if persistir else None
+        self._condicao = threading.Condition()
+        self._trabalhos = OrderedDict()
+        self._interromper = {}
+        self._iniciado = False
+        self._carregar()
+    
+    def _carregar(self):
+        if not self._arquivo or not os.path.exists(self._arquivo):
+            return
+        try:
+            with open(self._arquivo, 'r', encoding='utf-8') as f:
+                trabalhos = json.load(f).get('trabalhos', [])
+        except Exception as e:
+            print(f"Erro ao carregar fila de trabalhos: {e}")
+            return
+        
+        for trabalho in trabalhos:
+            if trabalho.get('estado') == TRABALHO_EXECUTANDO:
+                # O app fechou no meio do trabalho
+                pedido = trabalho.pop('pedido', None)
+                if pedido == 'cancelar':
+                    trabalho['estado'] = TRABALHO_CANCELADO
+                elif pedido == 'pausar':
+                    trabalho['estado'] = TRABALHO_PAUSADO
+                else:
+                    trabalho['estado'] = TRABALHO_NA_FILA
+            self._trabalhos[trabalho['id']] = trabalho
+    
+    def _salvar(self):
+        """Grava a fila (chamado com o lock); só os finalizados mais recentes são mantidos"""
+        finalizados = [t for t in self._trabalhos.values() if t['estado'] in TRABALHOS_FINALIZADOS]
+        for trabalho in finalizados[:max(0, len(finalizados) - TRABALHOS_FINALIZADOS_MAXIMO)]:
+            del self._trabalhos[trabalho['id']]
+            remover_estatisticas(trabalho['id'])
+        
+        if self._arquivo:
+            try:
+                _escrever_json_atomico(self._arquivo, {'trabalhos': list(self._trabalhos.values())})
+            except Exception as e:
+                print(f"Erro ao salvar fila de trabalhos: {e}")
+    
+    def _notificar(self):
+        if self.ao_mudar:
+            try:
+                self.ao_mudar()
+            except Exception as e:
+                print(f"Erro ao notificar mudança na fila: {e}")
+    
+    def _alterar(self, trabalho_id, funcao):
+        """Aplica funcao(trabalho) com o lock, grava a fila e inicia o que couber"""
+        with self._condicao:
+            trabalho = self._trabalhos.get(trabalho_id)
+            if trabalho is None:
+                return False
+            alterado = funcao(trabalho)
+            if alterado is False:
+                return False
+            self._salvar()
+            self._preencher_vagas()
+            self._condicao.notify_all()
+        self._notificar()
+        return True
+    
+    def adicionar(self, url, nome, formato='mp3', prioridade=PRIORIDADE_NORMAL, modo=MATERIALIZACAO_AUTO,
+                  sincronizar=False, remover_ausentes=False):
+        """Enfileira uma URL e retorna o id do trabalho
+        
+        Se o mesmo trabalho (URL, pasta e formato) já está pendente, retorna o id
+        dele em vez de criar outro.
+        """
+        with self._condicao:
+            for trabalho in self._trabalhos.values():
+                if (trabalho['estado'] not in TRABALHOS_FINALIZADOS and trabalho['url'] == url
+                        and trabalho['nome'] == nome and trabalho['formato'] == formato):
+                    return trabalho['id']
+            
+            ordem = max((t.get('ordem', 0) for t in self._trabalhos.values()), default=0) + 1
+            trabalho = {
+                'id': uuid.uuid4().hex[:12],
+                'url': url,
+                'nome': nome,
+                'formato': formato,
+                'modo': modo,
+                'sincronizar': sincronizar,
+                'remover_ausentes': remover_ausentes,
+                'prioridade': prioridade,
+                'ordem': ordem,
+                'estado': TRABALHO_NA_FILA,
+                'criado_em': time.time(),
+                'execucoes': 0,
+                'erro': None,
+                'resumo': None,
+            }
+            self._trabalhos[trabalho['id']] = trabalho
+            self._salvar()
+            self._preencher_vagas()
+        self._notificar()
+        return trabalho['id']
+    
+    def pausar(self, trabalho_id):
+        def _pausar(trabalho):
+            if trabalho['estado'] == TRABALHO_NA_FILA:
+                trabalho['estado'] = TRABALHO_PAUSADO
+            elif trabalho['estado'] == TRABALHO_EXECUTANDO:
+                trabalho['pedido'] = 'pausar'
+                self._interromper[trabalho_id].set()
+            else:
+                return False
+        return self._alterar(trabalho_id, _pausar)
+    
+    def retomar(self, trabalho_id):
+        def _retomar(trabalho):
+            if trabalho['estado'] not in (TRABALHO_PAUSADO, TRABALHO_CANCELADO, TRABALHO_FALHOU):
+                return False
+            trabalho['estado'] = TRABALHO_NA_FILA
+            trabalho['erro'] = None
+        return self._alterar(trabalho_id, _retomar)
+    
+    def cancelar(self, trabalho_id):
+        def _cancelar(trabalho):
+            if trabalho['estado'] in (TRABALHO_NA_FILA, TRABALHO_PAUSADO):
+                trabalho['estado'] = TRABALHO_CANCELADO
+            elif trabalho['estado'] == TRABALHO_EXECUTANDO:
+                trabalho['pedido'] = 'cancelar'
+                self._interromper[trabalho_id].set()
+            else:
+                return False
+        return self._alterar(trabalho_id, _cancelar)
+    
+    def remover(self, trabalho_id):
+        """Tira da lista um trabalho já finalizado"""
+        with self._condicao:
+            trabalho = self._trabalhos.get(trabalho_id)
+            if trabalho is None or trabalho['estado'] not in TRABALHOS_FINALIZADOS:
+                return False
+            del self._trabalhos[trabalho_id]
+            self._salvar()
+        remover_estatisticas(trabalho_id)
+        self._notificar()
+        return True
+    
+    def definir_prioridade(self, trabalho_id, prioridade):
+        def _definir(trabalho):
+            trabalho['prioridade'] = prioridade
+        return self._alterar(trabalho_id, _definir)
+    
+    def trabalhos(self):
+        """Cópia dos trabalhos: em execução, depois pendentes na ordem em que vão rodar, depois finalizados"""
+        grupos = {TRABALHO_EXECUTANDO: 0, TRABALHO_NA_FILA: 1, TRABALHO_PAUSADO: 2}
+        with self._condicao:
+            lista = [dict(t) for t in self._trabalhos.values()]
+        return sorted(lista, key=lambda t: (grupos.get(t['estado'], 3), -t['prioridade'], t['ordem']))
+    
+    def iniciar(self):
+        """Começa a executar a fila (inclusive o que sobrou de execuções anteriores)"""
+        with self._condicao:
+            self._iniciado = True
+            self._preencher_vagas()
+        self._notificar()
+    
+    def aguardar(self):
+        """Bloqueia até não haver trabalho na fila nem em execução (pausados não contam)"""
+        with self._condicao:
+            while self._interromper or any(t['estado'] == TRABALHO_NA_FILA for t in self._trabalhos.values()):
+                self._condicao.wait()
+    
+    def encerrar(self):
+        self.pool.encerrar()
+    
+    def _proximo(self):
+        pendentes = [t for t in self._trabalhos.values() if t['estado'] == TRABALHO_NA_FILA]
+        if not pendentes:
+            return None
+        return min(pendentes, key=lambda t: (-t['prioridade'], t['ordem']))
+    
+    def _preencher_vagas(self):
+        """Inicia os próximos trabalhos enquanto houver vaga (chamado com o lock)"""
+        if not self._iniciado:
+            return
+        while len(self._interromper) < self.jobs_simultaneos:
+            trabalho = self._proximo()
+            if trabalho is None:
+                break
+            trabalho['estado'] = TRABALHO_EXECUTANDO
+            trabalho['execucoes'] += 1
+            self._interromper[trabalho['id']] = threading.Event()
+            self._salvar()
+            threading.Thread(target=self._executar, args=(trabalho,), daemon=True).start()
+    
+    def _executar(self, trabalho):
+        # Um arquivo por trabalho: jobs simultâneos não sobrescrevem as estatísticas um do outro
+        metricas = Metricas(caminho_estatisticas(trabalho['id']))
+        observador = self.observador_para(dict(trabalho)) if self.observador_para else ObservadorJob()
+        if self.ao_iniciar:
+            self.ao_iniciar(dict(trabalho), metricas)
+        self._notificar()
+        
+        resultado = {'sucesso': False, 'erro': None}
+        try:
+            resultado = processar_download(
+                trabalho['url'], trabalho['nome'], trabalho['formato'], self.pool.num_workers, trabalho['modo'],
+                trabalho['sincronizar'] or trabalho['execucoes'] > 1, trabalho['remover_ausentes'],
+                observador, metricas, self.pool, self._interromper[trabalho['id']])
+        except Exception as e:
+            resultado['erro'] = str(e)
+        finally:
+            with self._condicao:
+                pedido = trabalho.pop('pedido', None)
+                if resultado.get('interrompido'):
+                    trabalho['estado'] = TRABALHO_CANCELADO if pedido == 'cancelar' else TRABALHO_PAUSADO
+                elif resultado.get('sucesso'):
+                    trabalho['estado'] = TRABALHO_CONCLUIDO
+                else:
+                    trabalho['estado'] = TRABALHO_FALHOU
+                    trabalho['erro'] = resultado.get('erro')
+                trabalho['resumo'] = {chave: resultado[chave] for chave in
+                                      ('tipo', 'total', 'copiados', 'baixados', 'erros', 'inalterados', 'arquivo')
+                                      if chave in resultado}
+                self._salvar()
+            
+            # A vaga só é liberada depois do callback, para que aguardar() inclua o resultado
+            try:
+                if self.ao_concluir:
+                    self.ao_concluir(dict(trabalho), resultado)
+            finally:
+                # Sem persistência o trabalho não volta numa próxima execução (ex.: CLI)
+                if self._arquivo is None:
+                    remover_estatisticas(trabalho['id'])
+                with self._condicao:
+                    del self._interromper[trabalho['id']]
+                    self._preencher_vagas()
+                    self._condicao.notify_all()
+                self._notificar()
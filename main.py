@@ -1,9 +1,8 @@
 import os
-import sys
-import shutil
-import json
-import hashlib
 import threading
+import logging
+import logging.handlers
+from collections import deque
 
 # Remove instalação automática de dependências (já vem no APK)
 # As dependências são instaladas pelo buildozer
@@ -13,258 +12,199 @@ from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
 from kivy.uix.label import Label
 from kivy.uix.textinput import TextInput
-from kivy.uix.scrollview import ScrollView
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.uix.progressbar import ProgressBar
 from kivy.uix.popup import Popup
 from kivy.uix.togglebutton import ToggleButton
 from kivy.clock import Clock
 from kivy.core.window import Window
+from kivy.metrics import dp
+from kivy.properties import StringProperty
+
+import core
 
 # Configurações para mobile
 Window.keyboard_anim_args = {'d': 0.2, 't': 'in_out_expo'}
 Window.softinput_mode = "below_target"
 
-def verificar_ffmpeg():
-    """Verifica se o FFmpeg está instalado no sistema"""
-    return shutil.which("ffmpeg") is not None
+# Frequência com que as mudanças enviadas pelas threads são aplicadas na interface
+UI_ATUALIZACOES_POR_SEGUNDO = 15
 
-def obter_caminho_base():
-    """Retorna o caminho base onde o script está localizado"""
-    if hasattr(sys, '_MEIPASS'):
-        return sys._MEIPASS
-    
-    script_path = os.path.dirname(os.path.abspath(__file__))
-    return script_path
+# Log: só as últimas linhas ficam na tela; o histórico completo vai para arquivos rotativos
+LOG_MAX_LINHAS = 500
+LOG_ARQUIVO = 'youtube_downloader.log'
+LOG_ARQUIVO_TAMANHO_MAXIMO = 1024 * 1024
+LOG_ARQUIVO_BACKUPS = 3
 
-def criar_estrutura_pastas():
-    """Cria a estrutura de pastas assets/playlists e assets/cache"""
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    base_dir = os.path.join(script_dir, 'YouTubeDownloader')
-    
-    # Em Android, tenta usar storage externo se disponível
-    try:
-        from android.storage import primary_external_storage_path
-        from android.permissions import request_permissions, Permission
-        request_permissions([
-            Permission.WRITE_EXTERNAL_STORAGE, 
-            Permission.READ_EXTERNAL_STORAGE,
-            Permission.INTERNET
-        ])
-        
-        storage_path = primary_external_storage_path()
-        base_dir = os.path.join(storage_path, 'YouTubeDownloader')
-    except:
-        pass
-    
-    pastas = [
-        base_dir,
-        os.path.join(base_dir, 'playlists'),
-        os.path.join(base_dir, 'cache', 'musicas'),
-        os.path.join(base_dir, 'cache', 'videos_individuais_mp3'),
-        os.path.join(base_dir, 'cache', 'videos_individuais_mp4')
-    ]
-    
-    for pasta in pastas:
-        try:
-            if not os.path.exists(pasta):
-                os.makedirs(pasta)
-        except Exception as e:
-            print(f"Erro ao criar pasta {pasta}: {e}")
-    
-    return base_dir
+# Como cada estado aparece na lista da fila de trabalhos
+ROTULOS_TRABALHO = {
+    core.TRABALHO_NA_FILA: 'Na fila',
+    core.TRABALHO_EXECUTANDO: '[color=00aaff]Baixando[/color]',
+    core.TRABALHO_PAUSADO: '[color=ffaa00]Pausado[/color]',
+    core.TRABALHO_CANCELADO: 'Cancelado',
+    core.TRABALHO_CONCLUIDO: '[color=00ff00]Concluído[/color]',
+    core.TRABALHO_FALHOU: '[color=ff0000]Falhou[/color]',
+}
 
-def carregar_cache():
-    """Carrega o arquivo JSON com o histórico de downloads"""
-    try:
-        base_path = criar_estrutura_pastas()
-        cache_file = os.path.join(base_path, 'cache', 'downloaded_tracks.json')
-        
-        if os.path.exists(cache_file):
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"Erro ao carregar cache: {e}")
+class BarramentoUI:
+    """Junta as atualizações de interface enviadas pelas threads e as aplica uma vez por quadro
     
-    return {}
-
-def salvar_cache(cache):
-    """Salva o cache atualizado no arquivo JSON"""
-    try:
-        base_path = criar_estrutura_pastas()
-        cache_file = os.path.join(base_path, 'cache', 'downloaded_tracks.json')
-        
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(cache, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        print(f"Erro ao salvar cache: {e}")
+    definir() guarda só o último valor de cada (objeto, atributo) e sinalizar()
+    agenda uma função uma única vez, não importa quantas vezes seja chamada
+    antes do próximo aplicar(). Assim o custo na thread da interface não
+    depende de quantos downloads estão rodando.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valores = {}
+        self._funcoes = {}
+    
+    def definir(self, objeto, atributo, valor):
+        chave = (id(objeto), atributo)
+        with self._lock:
+            # Reinsere para que a ordem de aplicação siga a da última alteração
+            self._valores.pop(chave, None)
+            self._valores[chave] = (objeto, atributo, valor)
+    
+    def sinalizar(self, nome, funcao):
+        with self._lock:
+            self._funcoes[nome] = funcao
+    
+    def aplicar(self, *args):
+        """Aplica as alterações pendentes (chamado na thread da interface)"""
+        with self._lock:
+            valores, self._valores = self._valores, {}
+            funcoes, self._funcoes = self._funcoes, {}
+        for objeto, atributo, valor in valores.values():
+            setattr(objeto, atributo, valor)
+        for funcao in funcoes.values():
+            funcao()
 
-def gerar_id_video(url_ou_id, formato='mp3'):
-    """Gera um ID único para o vídeo incluindo o formato"""
-    return hashlib.md5(f"{url_ou_id}_{formato}".encode()).hexdigest()
+class RegistroLog:
+    """Mantém as últimas LOG_MAX_LINHAS linhas do log em memória e grava tudo em disco
+    
+    adicionar() pode ser chamado de qualquer thread. O arquivo em logs/ é
+    rotacionado ao atingir LOG_ARQUIVO_TAMANHO_MAXIMO, sem o markup do Kivy.
+    """
+    
+    def __init__(self, max_linhas=LOG_MAX_LINHAS, pasta=None):
+        self._linhas = deque(maxlen=max_linhas)
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger('youtube_downloader')
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        
+        if pasta and not self._logger.handlers:
+            try:
+                os.makedirs(pasta, exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    os.path.join(pasta, LOG_ARQUIVO), maxBytes=LOG_ARQUIVO_TAMANHO_MAXIMO,
+                    backupCount=LOG_ARQUIVO_BACKUPS, encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+                self._logger.addHandler(handler)
+            except Exception as e:
+                print(f"Erro ao abrir arquivo de log: {e}")
+    
+    def adicionar(self, mensagem):
+        linhas = mensagem.split('\n')
+        with self._lock:
+            self._linhas.extend(linhas)
+        texto = core.remover_markup(mensagem).strip()
+        if texto:
+            self._logger.info(texto)
+    
+    def linhas(self):
+        with self._lock:
+            return list(self._linhas)
 
-def sanitizar_nome_arquivo(nome):
-    """Remove caracteres inválidos do nome do arquivo"""
-    caracteres_invalidos = '<>:"/\\|?*'
-    for char in caracteres_invalidos:
-        nome = nome.replace(char, '_')
-    return nome
+class LinhaLog(Label):
+    """Uma linha do log dentro do RecycleView"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(markup=True, font_size='11sp', halign='left', valign='middle',
+                         shorten=True, shorten_from='right', **kwargs)
+        self.bind(size=self.setter('text_size'))
 
-def detectar_tipo_url(url):
-    """Detecta se a URL é de uma playlist, vídeo individual ou clip"""
-    try:
-        import yt_dlp
-    except ImportError:
-        return None, "yt-dlp não está instalado"
-    
-    if '/clip/' in url:
-        try:
-            ydl_opts = {'quiet': True, 'no_warnings': True, 'extract_flat': False}
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                if info:
-                    return 'clip', info
-        except Exception as e:
-            return None, f"Erro ao acessar clip: {str(e)[:100]}"
-    
-    ydl_opts = {'quiet': True, 'no_warnings': True, 'extract_flat': True}
-    
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            
-            if 'entries' in info and info.get('_type') == 'playlist':
-                playlist_id = info.get('id', '')
-                if playlist_id.startswith('RD') or playlist_id.startswith('UL'):
-                    return 'video', info.get('entries', [{}])[0] if info.get('entries') else info
-                return 'playlist', info
-            else:
-                return 'video', info
-                
-    except Exception as e:
-        error_msg = str(e)
-        if 'unavailable' in error_msg.lower():
-            return None, "Vídeo indisponível"
-        elif 'private' in error_msg.lower():
-            return None, "Vídeo privado"
-        else:
-            return None, f"Erro: {error_msg[:100]}"
+class VisualizacaoLog(RecycleView):
+    """Lista virtualizada: só as linhas visíveis existem como widgets"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.viewclass = LinhaLog
+        caixa = RecycleBoxLayout(orientation='vertical',
+                                 default_size=(None, dp(18)),
+                                 default_size_hint=(1, None),
+                                 size_hint_y=None)
+        caixa.bind(minimum_height=caixa.setter('height'))
+        self.add_widget(caixa)
+    
+    def mostrar(self, linhas):
+        # Só acompanha o final do log se ele já estava visível (ou se ainda cabia
+        # inteiro na tela); quem rolou para cima fica onde está
+        no_final = self.scroll_y <= 0 or self.layout_manager.height <= self.height
+        self.data = [{'text': linha} for linha in linhas]
+        if no_final:
+            self.scroll_y = 0
 
-def obter_info_playlist(playlist_url):
-    """Obtém informações sobre os vídeos da playlist"""
-    try:
-        import yt_dlp
-        
-        ydl_opts = {'quiet': True, 'no_warnings': True, 'extract_flat': True}
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(playlist_url, download=False)
-            return info.get('entries', [])
-    except Exception as e:
-        print(f"Erro ao obter playlist: {e}")
-        return []
+def descrever_trabalho(trabalho):
+    """Texto de uma linha da fila: estado, prioridade e destino do trabalho"""
+    texto = ROTULOS_TRABALHO.get(trabalho['estado'], trabalho['estado'])
+    if trabalho['prioridade'] > core.PRIORIDADE_NORMAL:
+        texto += ' [b](alta)[/b]'
+    if (trabalho.get('resumo') or {}).get('tipo') == 'video':
+        return f"{texto} | {trabalho['url']}"
+    return f"{texto} | {trabalho['nome']} | {trabalho['url']}"
 
-def copiar_do_cache(video_hash, video_title, output_path, cache):
-    """Copia uma música do cache para a pasta da playlist"""
-    try:
-        cache_info = cache.get(video_hash)
-        if not cache_info:
-            return False
-        
-        arquivo_cache = cache_info.get('arquivo_cache')
-        if not arquivo_cache or not os.path.exists(arquivo_cache):
-            return False
-        
-        _, ext = os.path.splitext(arquivo_cache)
-        nome_sanitizado = sanitizar_nome_arquivo(video_title)
-        arquivo_destino = os.path.join(output_path, f"{nome_sanitizado}{ext}")
-        
-        shutil.copy2(arquivo_cache, arquivo_destino)
-        return True
-        
-    except Exception as e:
-        print(f"Erro ao copiar do cache: {e}")
-        return False
+class LinhaTrabalho(BoxLayout):
+    """Um trabalho da fila, com botões de prioridade, pausa e cancelamento"""
+    
+    trabalho_id = StringProperty('')
+    texto = StringProperty('')
+    estado = StringProperty('')
+    
+    def __init__(self, **kwargs):
+        super().__init__(orientation='horizontal', spacing=4, **kwargs)
+        self.rotulo = Label(markup=True, font_size='11sp', halign='left', valign='middle',
+                            shorten=True, shorten_from='right')
+        self.rotulo.bind(size=self.rotulo.setter('text_size'))
+        self.add_widget(self.rotulo)
+        
+        self.btn_prioridade = Button(text='+', size_hint_x=None, width=dp(32), font_size='12sp')
+        self.btn_pausa = Button(text='Pausar', size_hint_x=None, width=dp(64), font_size='11sp')
+        self.btn_cancelar = Button(text='X', size_hint_x=None, width=dp(32), font_size='12sp')
+        self.btn_prioridade.bind(on_press=lambda *a: App.get_running_app().priorizar_trabalho(self.trabalho_id))
+        self.btn_pausa.bind(on_press=lambda *a: App.get_running_app().alternar_pausa_trabalho(self.trabalho_id))
+        self.btn_cancelar.bind(on_press=lambda *a: App.get_running_app().cancelar_trabalho(self.trabalho_id))
+        self.add_widget(self.btn_prioridade)
+        self.add_widget(self.btn_pausa)
+        self.add_widget(self.btn_cancelar)
+        
+        self.bind(texto=self.rotulo.setter('text'), estado=self._atualizar_botoes)
+    
+    def _atualizar_botoes(self, *args):
+        finalizado = self.estado in core.TRABALHOS_FINALIZADOS
+        self.btn_pausa.text = 'Pausar' if self.estado in (core.TRABALHO_NA_FILA, core.TRABALHO_EXECUTANDO) else 'Retomar'
+        self.btn_prioridade.disabled = finalizado
+        self.btn_pausa.disabled = self.estado == core.TRABALHO_CONCLUIDO
 
-def download_para_cache(video_id, video_title, video_hash, cache, ffmpeg_disponivel, is_individual=False, formato_video='mp3'):
-    """Baixa uma música/vídeo diretamente para o cache"""
-    try:
-        import yt_dlp
-    except ImportError:
-        return False, "yt-dlp não está disponível"
-    
-    try:
-        base_path = criar_estrutura_pastas()
-        
-        if is_individual:
-            if formato_video == 'mp4':
-                cache_path = os.path.join(base_path, 'cache', 'videos_individuais_mp4')
-                tipo = 'individual_mp4'
-                formato = 'mp4'
-            else:
-                cache_path = os.path.join(base_path, 'cache', 'videos_individuais_mp3')
-                tipo = 'individual_mp3'
-                formato = 'mp3' if ffmpeg_disponivel else 'm4a'
-        else:
-            cache_path = os.path.join(base_path, 'cache', 'musicas')
-            tipo = 'playlist'
-            formato = 'mp3' if ffmpeg_disponivel else 'm4a'
-        
-        nome_arquivo = f"{video_hash}.{formato}"
-        arquivo_cache = os.path.join(cache_path, nome_arquivo)
-        
-        opcoes_comuns = {
-            'quiet': True,
-            'no_warnings': True,
-            'nocheckcertificate': True,
-            'user_agent': 'Mozilla/5.0 (Linux; Android 10) AppleWebKit/537.36',
-            'referer': 'https://www.youtube.com/',
-        }
-        
-        if formato_video == 'mp4' and is_individual:
-            ydl_opts = {
-                'format': 'best[ext=mp4]/best',
-                'outtmpl': arquivo_cache,
-                **opcoes_comuns
-            }
-        elif ffmpeg_disponivel and formato_video == 'mp3':
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }],
-                'outtmpl': os.path.join(cache_path, f"{video_hash}.%(ext)s"),
-                **opcoes_comuns
-            }
-        else:
-            ydl_opts = {
-                'format': 'bestaudio[ext=m4a]/bestaudio',
-                'outtmpl': arquivo_cache,
-                **opcoes_comuns
-            }
-        
-        video_url = f"https://www.youtube.com/watch?v={video_id}"
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([video_url])
-        
-        cache[video_hash] = {
-            'id': video_id,
-            'title': video_title,
-            'formato': formato,
-            'arquivo_cache': arquivo_cache,
-            'tipo': tipo
-        }
-        
-        salvar_cache(cache)
-        return True, None
-        
-    except Exception as e:
-        erro_str = str(e)
-        if '403' in erro_str or 'forbidden' in erro_str.lower():
-            return False, "Erro 403: Atualize o yt-dlp"
-        return False, f"Erro: {erro_str[:100]}"
+class VisualizacaoFila(RecycleView):
+    """Lista dos trabalhos da fila (virtualizada, como o log)"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.viewclass = LinhaTrabalho
+        caixa = RecycleBoxLayout(orientation='vertical',
+                                 default_size=(None, dp(30)),
+                                 default_size_hint=(1, None),
+                                 size_hint_y=None)
+        caixa.bind(minimum_height=caixa.setter('height'))
+        self.add_widget(caixa)
+    
+    def mostrar(self, trabalhos):
+        self.data = [{'trabalho_id': t['id'], 'estado': t['estado'], 'texto': descrever_trabalho(t)}
+                     for t in trabalhos]
 
 
 class YouTubeDownloaderApp(App):
@@ -316,7 +256,37 @@ class YouTubeDownloaderApp(App):
         formato_layout.add_widget(self.btn_mp4)
         layout.add_widget(formato_layout)
         
-        self.download_btn = Button(text='Iniciar Download',
+        workers_layout = BoxLayout(size_hint_y=None, height=50, spacing=10)
+        workers_label = Label(text='Downloads simultâneos:', font_size='14sp')
+        workers_layout.add_widget(workers_label)
+        
+        self.workers_input = TextInput(text=str(core.NUM_WORKERS_PADRAO),
+                                       multiline=False,
+                                       input_filter='int',
+                                       font_size='14sp')
+        workers_layout.add_widget(self.workers_input)
+        layout.add_widget(workers_layout)
+        
+        materializacao_layout = BoxLayout(size_hint_y=None, height=50, spacing=10)
+        materializacao_label = Label(text='Arquivos da playlist:', font_size='14sp')
+        materializacao_layout.add_widget(materializacao_label)
+        
+        self.btn_links = ToggleButton(text='Links', group='materializacao', state='down')
+        self.btn_copias = ToggleButton(text='Cópias', group='materializacao')
+        materializacao_layout.add_widget(self.btn_links)
+        materializacao_layout.add_widget(self.btn_copias)
+        layout.add_widget(materializacao_layout)
+        
+        sync_layout = BoxLayout(size_hint_y=None, height=50, spacing=10)
+        self.btn_sincronizar = ToggleButton(text='Sincronizar')
+        self.btn_remover = ToggleButton(text='Remover ausentes')
+        self.btn_prioridade = ToggleButton(text='Prioridade alta')
+        sync_layout.add_widget(self.btn_sincronizar)
+        sync_layout.add_widget(self.btn_remover)
+        sync_layout.add_widget(self.btn_prioridade)
+        layout.add_widget(sync_layout)
+        
+        self.download_btn = Button(text='Adicionar à Fila',
                                   size_hint_y=None,
                                   height=60,
                                   background_color=(0.2, 0.6, 1, 1),
@@ -335,24 +305,29 @@ class YouTubeDownloaderApp(App):
                                  font_size='12sp')
         layout.add_widget(self.status_label)
         
-        log_scroll = ScrollView(size_hint=(1, 1))
-        self.log_label = Label(text='',
-                              size_hint_y=None,
-                              font_size='11sp',
-                              markup=True,
-                              halign='left',
-                              valign='top')
-        self.log_label.bind(texture_size=self.log_label.setter('size'))
-        log_scroll.add_widget(self.log_label)
-        layout.add_widget(log_scroll)
+        self.metricas_label = Label(text='',
+                                    size_hint_y=None,
+                                    height=25,
+                                    font_size='11sp')
+        layout.add_widget(self.metricas_label)
+        self.metricas = None
+        self._progresso_bytes = False
+        # Com vários trabalhos rodando, só um controla a barra de progresso e o status
+        self.trabalho_em_destaque = None
+        Clock.schedule_interval(self._atualizar_metricas, 1.0)
+        
+        self.ui = BarramentoUI()
+        Clock.schedule_interval(self.ui.aplicar, 1.0 / UI_ATUALIZACOES_POR_SEGUNDO)
         
-        cache = carregar_cache()
-        mp3_ind = sum(1 for v in cache.values() if v.get('tipo') == 'individual_mp3')
-        mp4_ind = sum(1 for v in cache.values() if v.get('tipo') == 'individual_mp4')
-        playlists = sum(1 for v in cache.values() if v.get('tipo') == 'playlist')
+        self.registro_log = RegistroLog(pasta=os.path.join(core.criar_estrutura_pastas(), 'logs'))
+        self.fila_view = VisualizacaoFila(size_hint=(1, None), height=dp(96))
+        layout.add_widget(self.fila_view)
+        
+        self.log_view = VisualizacaoLog(size_hint=(1, 1))
+        layout.add_widget(self.log_view)
         
         self.cache_label = Label(
-            text=f'Cache: {len(cache)} itens | MP3: {mp3_ind+playlists} | MP4: {mp4_ind}',
+            text=self._texto_cache(),
             size_hint_y=None,
             height=30,
             font_size='11sp',
@@ -362,16 +337,51 @@ class YouTubeDownloaderApp(App):
         self.log('[b]YouTube Downloader v2.0[/b]')
         self.log('Sistema pronto!\n')
         
+        core.iniciar_limpeza_cache()
+        core.iniciar_verificacao_cache(self.log)
+        self.escalonador = core.Escalonador(
+            num_workers=core.normalizar_num_workers(self.workers_input.text.strip()),
+            observador_para=lambda trabalho: ObservadorApp(self, trabalho['id']),
+            ao_iniciar=self._trabalho_iniciado,
+            ao_concluir=self._trabalho_concluido,
+            ao_mudar=lambda: self.ui.sinalizar('fila', self._fila_ui))
+        pendentes = sum(1 for t in self.escalonador.trabalhos() if t['estado'] == core.TRABALHO_NA_FILA)
+        if pendentes:
+            self.log(f'Retomando {pendentes} trabalhos da fila...')
+        self.escalonador.iniciar()
+        self._fila_ui()
+        if core.iniciar_retentativas_pendentes(self.log, self.escalonador.pool):
+            self.log('Retomando downloads pendentes em segundo plano...')
+        
         return layout
     
+    def _texto_cache(self):
+        # Contadores mantidos pelo índice do cache: não percorre as entradas
+        contadores = core.contadores_cache()
+        itens = {tipo: c['itens'] for tipo, c in contadores.items()}
+        total = sum(itens.values())
+        tamanho = core.formatar_bytes(sum(c['bytes'] for c in contadores.values()))
+        mp3 = itens.get('individual_mp3', 0) + itens.get('playlist', 0)
+        return f"Cache: {total} itens ({tamanho}) | MP3: {mp3} | MP4: {itens.get('individual_mp4', 0)}"
+    
     def log(self, mensagem):
-        Clock.schedule_once(lambda dt: self._log_ui(mensagem))
+        self.registro_log.adicionar(mensagem)
+        self.ui.sinalizar('log', self._log_ui)
     
-    def _log_ui(self, mensagem):
-        self.log_label.text += mensagem + '\n'
+    def _log_ui(self):
+        self.log_view.mostrar(self.registro_log.linhas())
+    
+    def _atualizar_metricas(self, dt):
+        if self.metricas is None:
+            return
+        self.metricas_label.text = self.metricas.texto_resumo()
+        if self._progresso_bytes:
+            progresso = self.metricas.resumo()['progresso_download_atual']
+            if progresso is not None:
+                self.progress.value = progresso
     
     def atualizar_status(self, mensagem):
-        Clock.schedule_once(lambda dt: setattr(self.status_label, 'text', mensagem))
+        self.ui.definir(self.status_label, 'text', mensagem)
     
     def mostrar_popup(self, titulo, mensagem):
         def _show():
@@ -390,141 +400,110 @@ class YouTubeDownloaderApp(App):
         url = self.url_input.text.strip()
         nome = self.nome_input.text.strip()
         formato = 'mp3' if self.btn_mp3.state == 'down' else 'mp4'
+        num_workers = core.normalizar_num_workers(self.workers_input.text.strip())
+        modo = core.MATERIALIZACAO_AUTO if self.btn_links.state == 'down' else core.MATERIALIZACAO_COPIA
+        sincronizar = self.btn_sincronizar.state == 'down'
+        remover_ausentes = self.btn_remover.state == 'down'
+        prioridade = core.PRIORIDADE_ALTA if self.btn_prioridade.state == 'down' else core.PRIORIDADE_NORMAL
         
         if not url:
             self.mostrar_popup('Atenção', 'Por favor, insira a URL!')
             return
         
-        if not url.startswith('http'):
-            if url.startswith('www.') or url.startswith('youtube.com') or url.startswith('youtu.be'):
-                url = 'https://' + url
-        
-        if '?list=RD' in url or '&list=RD' in url:
-            import re
-            video_match = re.search(r'(?:v=|youtu\.be/)([a-zA-Z0-9_-]{11})', url)
-            if video_match:
-                video_id = video_match.group(1)
-                url = f'https://www.youtube.com/watch?v={video_id}'
-                self.log('[color=ffaa00]Playlist automática detectada - usando vídeo individual[/color]')
-        
-        self.download_btn.disabled = True
-        self.atualizar_status('Processando...')
-        
-        thread = threading.Thread(target=self.processar_download, args=(url, nome, formato))
-        thread.daemon = True
-        thread.start()
-    
-    def processar_download(self, url, nome, formato):
-        try:
-            self.log('\n[b]Detectando tipo...[/b]')
-            tipo, info = detectar_tipo_url(url)
-            
-            if tipo is None:
-                erro = info if isinstance(info, str) else "Erro ao acessar"
-                self.log(f'[color=ff0000]{erro}[/color]')
-                self.atualizar_status('Erro')
-                self.mostrar_popup('Erro', erro)
-                return
-            
-            if tipo == 'playlist':
-                self.log(f'[color=00ff00]Playlist detectada[/color]')
-                self.log(f'Título: {info.get("title", "N/A")}')
-                self.download_playlist(url, nome)
-            else:
-                self.log(f'[color=00ff00]Vídeo individual detectado[/color]')
-                self.log(f'Título: {info.get("title", "N/A")}')
-                self.download_video(url, info, formato)
-                
-        except Exception as e:
-            self.log(f'[color=ff0000]Erro: {str(e)}[/color]')
-            self.mostrar_popup('Erro', str(e))
-        finally:
-            Clock.schedule_once(lambda dt: setattr(self.download_btn, 'disabled', False))
-            Clock.schedule_once(lambda dt: setattr(self.progress, 'value', 0))
-    
-    def download_video(self, url, info, formato):
-        base_path = criar_estrutura_pastas()
-        cache = carregar_cache()
-        
-        video_id = info.get('id', '')
-        video_title = info.get('title', 'Sem título')
-        video_hash = gerar_id_video(video_id, formato)
-        ffmpeg_disponivel = verificar_ffmpeg()
+        url, aviso = core.preparar_url(url)
+        if aviso:
+            self.log(aviso)
         
-        Clock.schedule_once(lambda dt: setattr(self.progress, 'max', 1))
-        
-        if video_hash in cache:
-            arquivo = cache[video_hash].get('arquivo_cache')
-            if arquivo and os.path.exists(arquivo):
-                self.log('[color=00ff00]Já está no cache![/color]')
-                self.mostrar_popup('Sucesso', f'Arquivo já baixado!\n\n{arquivo}')
-                Clock.schedule_once(lambda dt: setattr(self.progress, 'value', 1))
-                return
-        
-        self.log('Baixando...')
-        sucesso, erro = download_para_cache(video_id, video_title, video_hash, cache, ffmpeg_disponivel, True, formato)
-        
-        if sucesso:
-            arquivo = cache[video_hash].get('arquivo_cache')
-            self.log(f'[color=00ff00]Sucesso![/color]\n{arquivo}')
-            self.mostrar_popup('Sucesso', f'Download concluído!\n\n{arquivo}')
-            Clock.schedule_once(lambda dt: setattr(self.progress, 'value', 1))
+        # As vagas de rede são de todos os trabalhos; o valor vale a partir do próximo download
+        self.escalonador.pool.definir_num_workers(num_workers)
+        self.escalonador.adicionar(url, nome, formato, prioridade, modo, sincronizar, remover_ausentes)
+        self.url_input.text = ''
+        self.log(f'Adicionado à fila: {url}')
+    
+    def _fila_ui(self):
+        self.fila_view.mostrar(self.escalonador.trabalhos())
+    
+    def priorizar_trabalho(self, trabalho_id):
+        trabalho = next((t for t in self.escalonador.trabalhos() if t['id'] == trabalho_id), None)
+        if trabalho is not None:
+            alta = trabalho['prioridade'] > core.PRIORIDADE_NORMAL
+            self.escalonador.definir_prioridade(trabalho_id, core.PRIORIDADE_NORMAL if alta else core.PRIORIDADE_ALTA)
+    
+    def alternar_pausa_trabalho(self, trabalho_id):
+        if not self.escalonador.pausar(trabalho_id):
+            self.escalonador.retomar(trabalho_id)
+    
+    def cancelar_trabalho(self, trabalho_id):
+        if not self.escalonador.cancelar(trabalho_id):
+            self.escalonador.remover(trabalho_id)
+    
+    def _trabalho_iniciado(self, trabalho, metricas):
+        self.log(f"\n[b]Trabalho iniciado:[/b] {trabalho['url']}")
+        self.metricas = metricas
+        self.trabalho_em_destaque = trabalho['id']
+    
+    def _trabalho_concluido(self, trabalho, resultado):
+        if self.trabalho_em_destaque == trabalho['id']:
+            self.trabalho_em_destaque = None
+            self._progresso_bytes = False
+            self.ui.definir(self.progress, 'value', 0)
+        self.ui.definir(self.cache_label, 'text', self._texto_cache())
+        if trabalho['estado'] == core.TRABALHO_PAUSADO:
+            self.log(f"Trabalho pausado: {trabalho['url']}")
+        elif trabalho['estado'] == core.TRABALHO_CANCELADO:
+            self.log(f"Trabalho cancelado: {trabalho['url']}")
         else:
-            self.log(f'[color=ff0000]{erro}[/color]')
-            self.mostrar_popup('Erro', erro)
+            self.mostrar_popup(*self._popup_resultado(resultado))
     
-    def download_playlist(self, url, nome):
-        base_path = criar_estrutura_pastas()
-        output_path = os.path.join(base_path, 'playlists', nome)
-        
-        try:
-            if not os.path.exists(output_path):
-                os.makedirs(output_path)
-        except Exception as e:
-            self.log(f'[color=ff0000]Erro ao criar pasta: {e}[/color]')
-            return
-        
-        cache = carregar_cache()
-        ffmpeg_disponivel = verificar_ffmpeg()
-        
-        videos = obter_info_playlist(url)
-        if not videos:
-            self.log('[color=ff0000]Erro ao obter playlist[/color]')
+    def _popup_resultado(self, resultado):
+        """Título e mensagem do popup exibido ao fim de um job"""
+        if resultado.get('tipo') == 'playlist' and resultado.get('sucesso'):
+            resumo = f"Copiados: {resultado['copiados']}\nBaixados: {resultado['baixados']}\nErros: {resultado['erros']}"
+            if resultado['inalterados'] or resultado['removidos']:
+                resumo += f"\nInalterados: {resultado['inalterados']}\nRemovidos: {resultado['removidos']}"
+            return 'Concluído', resumo
+        if resultado.get('tipo') == 'video' and resultado.get('sucesso'):
+            if resultado.get('do_cache'):
+                return 'Sucesso', f"Arquivo já baixado!\n\n{resultado['arquivo']}"
+            return 'Sucesso', f"Download concluído!\n\n{resultado['arquivo']}"
+        return 'Erro', resultado.get('erro') or 'Erro ao acessar'
+
+
+class ObservadorApp(core.ObservadorJob):
+    """Leva o andamento de um trabalho para a interface, pelo BarramentoUI do app
+    
+    O log recebe as mensagens de todos os trabalhos; a barra de progresso e o
+    status só as do trabalho em destaque (o último iniciado ainda em execução).
+    """
+    
+    def __init__(self, app, trabalho_id=None):
+        self.app = app
+        self.trabalho_id = trabalho_id
+    
+    def _em_destaque(self):
+        if self.app.trabalho_em_destaque is None:
+            self.app.trabalho_em_destaque = self.trabalho_id
+        return self.app.trabalho_em_destaque == self.trabalho_id
+    
+    def log(self, mensagem):
+        self.app.log(mensagem)
+    
+    def status(self, mensagem):
+        if self._em_destaque():
+            self.app.atualizar_status(mensagem)
+    
+    def progresso(self, valor=None, maximo=None):
+        if not self._em_destaque():
             return
-        
-        self.log(f'Encontrados {len(videos)} vídeos\n')
-        Clock.schedule_once(lambda dt: setattr(self.progress, 'max', len(videos)))
-        
-        copiados = baixados = erros = 0
-        
-        for i, video in enumerate(videos, 1):
-            if not video:
-                continue
-            
-            video_id = video.get('id', '')
-            video_title = video.get('title', 'Sem título')
-            video_hash = gerar_id_video(video_id, 'mp3')
-            
-            self.log(f'[{i}/{len(videos)}] {video_title[:40]}...')
-            Clock.schedule_once(lambda dt, v=i: setattr(self.progress, 'value', v))
-            
-            if video_hash in cache:
-                if copiar_do_cache(video_hash, video_title, output_path, cache):
-                    copiados += 1
-                    continue
-            
-            sucesso, erro = download_para_cache(video_id, video_title, video_hash, cache, ffmpeg_disponivel, False)
-            if sucesso:
-                if copiar_do_cache(video_hash, video_title, output_path, cache):
-                    baixados += 1
-                else:
-                    erros += 1
-            else:
-                erros += 1
-        
-        self.log(f'\n[color=00ff00]Concluído![/color]')
-        self.log(f'Copiados: {copiados} | Baixados: {baixados} | Erros: {erros}')
-        self.mostrar_popup('Concluído', f'Copiados: {copiados}\nBaixados: {baixados}\nErros: {erros}')
+        if maximo is not None:
+            self.app.ui.definir(self.app.progress, 'max', maximo)
+        if valor is not None:
+            self.app.ui.definir(self.app.progress, 'value', valor)
+    
+    def download_unico(self, ativo):
+        # A barra passa a acompanhar os bytes do download (ver _atualizar_metricas)
+        if self._em_destaque():
+            self.app._progresso_bytes = ativo
 
 
 if __name__ == '__main__':